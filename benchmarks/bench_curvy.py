@@ -0,0 +1,195 @@
+# Benchmarks for the hot paths of the axis and the curve builder.
+#
+# Runs every benchmark over a range of horizons (number of periods), resolutions and batch
+# sizes, and records the best wall time and the peak memory (from tracemalloc) of each.
+# The results are written as JSON. Given a baseline from an earlier run, the benchmarks
+# that got slower or use more memory than the thresholds are reported, and the script
+# exits with status 1.
+#
+# Ex: PYTHONPATH=. python benchmarks/bench_curvy.py --output new.json --baseline old.json
+import argparse
+import datetime
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import curvy
+from curvy import axis, builder
+
+START_DATE = datetime.datetime(2018, 11, 26)
+HORIZONS = [12, 60, 120, 600]
+RESOLUTIONS = ['D', 'h']
+BATCH_SIZES = [1, 100, 1000]
+# Sub-daily curves and dense solves get too large for the longest horizons.
+MAX_HORIZON = {'h': 120, 'dense': 120}
+
+# Returns the prices for a horizon, with the same seed every run.
+def make_prices(num_periods, batch_size=None):
+    rng = np.random.default_rng(num_periods)
+    shape = (num_periods,) if batch_size is None else (batch_size, num_periods)
+    return 30 + 10 * rng.random(shape)
+
+# Returns the date ranges, taus, knots and B for a horizon.
+def make_system(num_periods, resolution='D'):
+    dr = axis.date_ranges(START_DATE, num_periods - 2, resolution=resolution)
+    taus = axis.start_end_index_array(axis.range_lengths(dr), overlap=1)
+    knots = axis.knot_index_array(taus)
+    return dr, taus, knots, builder.calc_B(make_prices(len(taus)), taus)
+
+# Returns the benchmarks as (name, params, setup) where setup returns the function to time.
+def benchmarks(horizons, resolutions, batch_sizes):
+    cases = []
+    for n in horizons:
+        cases.append(('axis.date_ranges', {'periods': n}, lambda n=n: lambda: axis.date_ranges(START_DATE, n - 2)))
+        cases.append(('axis.get_ranges', {'periods': n}, lambda n=n: lambda: axis.get_ranges(START_DATE, make_prices(n))))
+        cases.append(('axis.period_axis', {'periods': n}, lambda n=n: lambda: axis.period_axis(START_DATE, n - 2)))
+
+        def big_H(n=n):
+            dr, taus, knots, B = make_system(n)
+            return lambda: builder.calc_big_H(taus)
+        cases.append(('builder.calc_big_H', {'periods': n}, big_H))
+
+        def big_A(n=n):
+            dr, taus, knots, B = make_system(n)
+            return lambda: builder.calc_big_A(knots, taus)
+        cases.append(('builder.calc_big_A', {'periods': n}, big_A))
+
+        def calc_B(n=n):
+            dr, taus, knots, B = make_system(n)
+            return lambda: builder.calc_B(make_prices(n), taus)
+        cases.append(('builder.calc_B', {'periods': n}, calc_B))
+
+        def banded_kkt(n=n):
+            dr, taus, knots, B = make_system(n)
+            return lambda: builder.calc_banded_kkt(knots, taus, local=True)
+        cases.append(('builder.calc_banded_kkt', {'periods': n}, banded_kkt))
+
+        if n <= MAX_HORIZON['dense']:
+            def dense(n=n):
+                dr, taus, knots, B = make_system(n)
+                H, A = builder.calc_big_H(taus), builder.calc_big_A(knots, taus)
+                return lambda: builder.solve_lineq(H, A, B)
+            cases.append(('builder.solve_lineq', {'periods': n}, dense))
+
+        def banded(n=n):
+            dr, taus, knots, B = make_system(n)
+            return lambda: builder.solve_banded_lineq(knots, taus, B)
+        cases.append(('builder.solve_banded_lineq', {'periods': n}, banded))
+
+        def values(n=n):
+            dr, taus, knots, B = make_system(n)
+            X = builder.solve_banded_lineq(knots, taus, B)
+            return lambda: builder.curve_values(dr, X, builder.smfc, flatten=True)
+        cases.append(('builder.curve_values', {'periods': n}, values))
+
+        for resolution in resolutions:
+            if n > MAX_HORIZON.get(resolution, n):
+                continue
+            for corr_avg in [False, True]:
+                params = {'periods': n, 'resolution': resolution, 'corr_avg': corr_avg}
+
+                def build(n=n, resolution=resolution, corr_avg=corr_avg, plan_cache=True):
+                    prices = list(make_prices(n))
+                    def run():
+                        if not plan_cache:
+                            builder.clear_plan_cache()
+                        return builder.build_smfc_curve(prices, START_DATE, corr_avg=corr_avg,
+                                                        resolution=resolution, output='arrays')
+                    return run
+                cases.append(('builder.build_smfc_curve', dict(params, plan_cache=True), build))
+                cases.append(('builder.build_smfc_curve', dict(params, plan_cache=False),
+                              lambda build=build: build(plan_cache=False)))
+                if n <= MAX_HORIZON['dense']:
+                    def build_dense(n=n, resolution=resolution, corr_avg=corr_avg):
+                        prices = list(make_prices(n))
+                        return lambda: builder.build_smfc_curve(prices, START_DATE, corr_avg=corr_avg, method='dense',
+                                                                resolution=resolution, output='arrays')
+                    cases.append(('builder.build_smfc_curve', dict(params, method='dense'), build_dense))
+
+        for batch_size in batch_sizes:
+            def batch(n=n, batch_size=batch_size):
+                prices = make_prices(n, batch_size)
+                return lambda: builder.build_smfc_curves(prices, START_DATE, output='arrays')
+            cases.append(('builder.build_smfc_curves', {'periods': n, 'batch_size': batch_size}, batch))
+    return cases
+
+# Returns the best wall time over repeat runs and the peak memory of a separate run.
+def measure(func, repeat, min_time=0.2):
+    func()
+    times = []
+    started = time.perf_counter()
+    while len(times) < repeat or (time.perf_counter() - started < min_time and len(times) < 100 * repeat):
+        t = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - t)
+    tracemalloc.start()
+    func()
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return min(times), peak_memory
+
+def run(horizons, resolutions, batch_sizes, repeat, pattern=None):
+    results = []
+    for name, params, setup in benchmarks(horizons, resolutions, batch_sizes):
+        if pattern and pattern not in name:
+            continue
+        best, peak_memory = measure(setup(), repeat)
+        results.append({'name': name, 'params': params, 'time': best, 'peak_memory': peak_memory})
+        print('{:<30} {:<70} {:>10.3f} ms {:>10.1f} kB'.format(
+            name, json.dumps(params, sort_keys=True), 1000 * best, peak_memory / 1024))
+    return {
+        'curvy': curvy.__version__,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'machine': platform.machine(),
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'results': results,
+    }
+
+# Returns the benchmarks in results that are more than time_threshold times slower or use
+# more than memory_threshold times the memory of the same benchmark in the baseline.
+def compare(results, baseline, time_threshold=1.25, memory_threshold=1.25):
+    def key(result):
+        return result['name'], json.dumps(result['params'], sort_keys=True)
+    previous = {key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        old = previous.get(key(result))
+        if old is None:
+            continue
+        time_ratio = result['time'] / old['time']
+        memory_ratio = result['peak_memory'] / max(old['peak_memory'], 1)
+        if time_ratio > time_threshold or memory_ratio > memory_threshold:
+            regressions.append((key(result), time_ratio, memory_ratio))
+    return regressions
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the curvy axis and builder.')
+    parser.add_argument('--output', help='Write the results as JSON to this file')
+    parser.add_argument('--baseline', help='Compare against the JSON results in this file')
+    parser.add_argument('--time-threshold', type=float, default=1.25)
+    parser.add_argument('--memory-threshold', type=float, default=1.25)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--horizons', type=int, nargs='+', default=HORIZONS)
+    parser.add_argument('--resolutions', nargs='+', default=RESOLUTIONS)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=BATCH_SIZES)
+    parser.add_argument('--filter', help='Only run the benchmarks with this in their name')
+    args = parser.parse_args(argv)
+
+    results = run(args.horizons, args.resolutions, args.batch_sizes, args.repeat, args.filter)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.time_threshold, args.memory_threshold)
+        for (name, params), time_ratio, memory_ratio in regressions:
+            print('REGRESSION {} {}: {:.2f}x time, {:.2f}x memory'.format(name, params, time_ratio, memory_ratio))
+        if regressions:
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
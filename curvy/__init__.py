@@ -1,8 +1,10 @@
 from . import builder
 from . import axis
+from . import curve
+from . import products
 #from . import plot
 
 __version__ = '0.1.0'
 __author__ = 'Joachim Holwech joachim.holwech@gmail.com'
 #__all__ = ['builder', 'axis', 'plot']
-__all__ = ['builder', 'axis']
\ No newline at end of file
+__all__ = ['builder', 'axis', 'curve', 'products']
\ No newline at end of file
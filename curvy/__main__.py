@@ -0,0 +1,4 @@
+import sys
+from curvy import cli
+
+sys.exit(cli.main())
@@ -1,61 +1,138 @@
-import scipy
 import datetime
-import calendar
+import itertools
 import numpy as np
-from dateutil.relativedelta import relativedelta
-import math
+from collections import namedtuple
+
+# Compact representation of date ranges: all dates as one contiguous datetime64 array,
+# plus the offset of the first date and the number of dates in each period.
+PeriodAxis = namedtuple('PeriodAxis', ['dates', 'starts', 'lengths'])
+
+# Converts a date or datetime into a numpy datetime64 with daily resolution.
+def to_day(date):
+    return np.datetime64(datetime.date(date.year, date.month, date.day), 'D')
+
+# Returns the first day of the month for the month of each day.
+def month_start(days):
+    return days.astype('datetime64[M]').astype('datetime64[D]')
 
 # Takes in the start date for the Day Ahead and converts in into a datetime with daily resolution.
 def da_date(start_date):
-    return datetime.date(start_date.year, start_date.month, start_date.day + 1)
+    return datetime.date(start_date.year, start_date.month, start_date.day) + datetime.timedelta(days=1)
 
 # Takes in the start date for the Bound of Month and returns a list of all days remaining in the BOM.
 def bom_dates(start_date):
-    start_year, start_month, start_day = start_date.year, start_date.month, start_date.day + 2
-    bom = []
-    bom_days = calendar.monthrange(start_year, start_month)[1]
-    for day in range(start_day, bom_days + 1):
-        bom.append(datetime.date(start_year, start_month, day))
-    return bom
+    month = to_day(start_date).astype('datetime64[M]')
+    return np.arange(to_day(start_date) + 2, (month + 1).astype('datetime64[D]')).tolist()
 
 # Takes in the start date for BOM and returns a list of all days in the first full month following BOM.
 # If num_steps is larger than 1, the function will return a list of list containing each full month for
 # each step defined in num_steps.
 def eom_dates(start_date, num_steps):
     # Monthly
-    eoms = []
-    for i in range(1, num_steps + 1):
-        current_eom = start_date + relativedelta(months=+i)
-        eom_days = calendar.monthrange(current_eom.year, current_eom.month)[1]
-        eom = []
-        for day in range(1, eom_days + 1):
-            eom.append(datetime.date(current_eom.year, current_eom.month, day))
-        eoms.append(eom)
-    return eoms
+    months = month_start(to_day(start_date)).astype('datetime64[M]') + np.arange(1, num_steps + 2)
+    bounds = months.astype('datetime64[D]')
+    return [np.arange(b, e).tolist() for b, e in zip(bounds[:-1], bounds[1:])]
 
-# Return the DA, BOM and EOM for a given number of steps.
-# TODO: Implement other date systems.
-def date_ranges(start_date, num_eoms, date_system='monthly'):
-    # Day ahead
-    da = da_date(start_date)
+# Time step of each supported resolution.
+RESOLUTIONS = {
+    'D': np.timedelta64(1, 'D'),
+    'h': np.timedelta64(60, 'm'),
+    '30min': np.timedelta64(30, 'm'),
+    '15min': np.timedelta64(15, 'm'),
+}
+
+# Returns the time step of the resolution.
+def resolution_step(resolution):
+    if resolution not in RESOLUTIONS:
+        raise ValueError('Unknown resolution "{}". Use one of {}'.format(resolution, list(RESOLUTIONS)))
+    return RESOLUTIONS[resolution]
+
+# Returns the first day of the DA, BOM and EOM periods followed by the day after the last
+# EOM, for a given number of EOM steps. The BOM is left out if it has no days left.
+# Other products (weeks, quarters, seasons, years) are resolved by products.product_bounds.
+def period_bounds(start_date, num_eoms, date_system='monthly'):
+    da = to_day(da_date(start_date))
+    bounds = [np.array([da])]
     # Bound of month
-    bom = bom_dates(start_date)
+    if month_start(da + 1) == month_start(da):
+        bounds.append(np.array([da + 1]))
     # eom
-    eom = eom_dates(start_date, num_eoms)
-    if ((start_date + relativedelta(days=+2)).month != start_date.month):
-        return [[da]] + eom
-    else:
-        return [[da]] + [bom] + eom
+    months = da.astype('datetime64[M]') + np.arange(1, num_eoms + 2)
+    bounds.append(months.astype('datetime64[D]'))
+    return np.concatenate(bounds)
+
+# Returns the number of EOM steps for a strip of num_periods prices. The strip is the DA,
+# the BOM and the months, or the DA and the months when the BOM has no days left (the
+# last but one day of the month).
+def strip_eoms(start_date, num_periods):
+    da = to_day(da_date(start_date))
+    return num_periods - 2 if month_start(da + 1) == month_start(da) else num_periods - 1
+
+# Converts days at local midnight in the time zone tz (e.g. 'Europe/Oslo') into UTC
+# datetime64 values with minute resolution. Only the given days are converted, so this
+# is cheap for period bounds.
+def local_midnight_to_utc(days, tz):
+    minutes = days.astype('datetime64[m]')
+    if tz is None:
+        return minutes
+    from zoneinfo import ZoneInfo
+    zone = ZoneInfo(tz)
+    offsets = [
+        datetime.datetime.combine(day, datetime.time(), tzinfo=zone).utcoffset() // datetime.timedelta(minutes=1)
+        for day in days.tolist()
+    ]
+    return minutes - np.array(offsets, dtype='timedelta64[m]')
+
+# Builds a PeriodAxis from the first day of each period followed by the day after the
+# last period. With a sub-daily resolution ('h', '30min' or '15min') and a time zone,
+# the periods start at local midnight, so the number of steps follows the daylight saving
+# time changes (e.g. 23 and 25 hours), and the steps are given in UTC.
+def bounds_axis(bounds, resolution='D', tz=None):
+    first, offsets = bounds_offsets(bounds, resolution, tz)
+    return PeriodAxis(np.arange(first, first + offsets[-1] * resolution_step(resolution),
+                                resolution_step(resolution)), offsets[:-1], np.diff(offsets))
+
+# Returns the first bound in the resolution (in UTC for sub-daily resolutions with a time
+# zone, see bounds_axis) and the offset of each bound from it in steps. Same as
+# bounds_axis, but without the dates.
+def bounds_offsets(bounds, resolution='D', tz=None):
+    step = resolution_step(resolution)
+    if resolution != 'D':
+        bounds = local_midnight_to_utc(bounds, tz)
+    return bounds[0], ((bounds - bounds[0]) // step).astype('int64')
+
+# Returns the DA, BOM and EOM periods for a given number of EOM steps as a PeriodAxis.
+def period_axis(start_date, num_eoms, date_system='monthly', resolution='D', tz=None):
+    return bounds_axis(period_bounds(start_date, num_eoms, date_system), resolution, tz)
+
+# Splits the dates of a PeriodAxis into a list of lists of datetime.date (or datetime.datetime
+# for sub-daily resolutions), one per period.
+def axis_ranges(period_axis):
+    dates = period_axis.dates.tolist()
+    return [dates[s:s + l] for s, l in zip(period_axis.starts.tolist(), period_axis.lengths.tolist())]
+
+# Return the DA, BOM and EOM for a given number of steps.
+def date_ranges(start_date, num_eoms, date_system='monthly', resolution='D', tz=None):
+    return axis_ranges(period_axis(start_date, num_eoms, date_system, resolution, tz))
+
+# Returns the number of values in each range as an array.
+# Ex: [[1, 2, 3], [4, 5]] -> [3, 2]
+def range_lengths(ranges):
+    return np.array([len(r) for r in ranges], dtype='int64')
+
+# Repeats each price over the number of steps in its range.
+# Ex: price_array([3, 2], [1, 2]) -> [1, 1, 1, 2, 2]
+def price_array(lengths, forward_prices):
+    if len(lengths) != len(forward_prices):
+        raise ValueError('The number of date ranges and forwards prices need to be the same')
+    return np.repeat(np.asarray(forward_prices), lengths)
 
 # Copies the date range with equivalent ranges of price values
 # Ex: prices_ranges([[1,2,3], [4,5,6]], [1,2])) -> [[1,1,1],[2,2,2]]
 def price_ranges(date_ranges, forward_prices):
-    if len(date_ranges) != len(forward_prices):
-        raise ValueError('The number of date ranges and forwards prices need to be the same')
-    y = []
-    for i, date_range in enumerate(date_ranges):
-        y.append([forward_prices[i]] * len(date_range))
-    return y
+    lengths = range_lengths(date_ranges)
+    y = price_array(lengths, forward_prices).tolist()
+    return [y[s:e] for s, e in zip(np.cumsum(lengths) - lengths, np.cumsum(lengths))]
 
 # Flattens a 2D list with ranges into a 1D list of range values
 # Ex: [[1,2],[3,4]] -> [1,2,3,4]
@@ -63,19 +140,14 @@ def price_ranges(date_ranges, forward_prices):
 # Ex: [[1,2,3],[3,4,5]] -> [1,2,3,4]
 def flatten_ranges(ranges, no_overlap=False):
     if no_overlap:
-        return [i for i in range(ranges[0][0], ranges[-1][-1])]
+        return list(range(ranges[0][0], ranges[-1][-1]))
     else:
-        return [item for sublist in ranges for item in sublist]
+        return list(itertools.chain.from_iterable(ranges))
 
 # Returns a list of the midpoint value in each range
 # Ex: [[3, 5, 6], [3, 1, 8, 7]] -> [5, 8]
 def midpoint_values(ranges, include_last=False):
-    midpoints = []
-    len_count = 0
-    for r in ranges:
-        mp_index = len(r) // 2
-        midpoints.append(r[mp_index])
-        len_count += len(r)
+    midpoints = [r[mp_index] for r, mp_index in zip(ranges, midpoint_relative_index(ranges))]
     if include_last:
         midpoints.append(ranges[-1][-1])
     return midpoints
@@ -84,65 +156,81 @@ def midpoint_values(ranges, include_last=False):
 # Ex: [[3, 5, 6, 3], [3, 1, 8, 7, 8]] -> [2, 2]
 # TODO: Test with include last param
 def midpoint_relative_index(ranges):
-    relative_index = []
-    len_count = 0
-    for r in ranges:
-        mp_index = len(r) // 2
-        relative_index.append(mp_index)
-        len_count += len(r)
-    return relative_index
+    return (range_lengths(ranges) // 2).tolist()
+
+# Same as midpoint_absolute_index, but from the length of each range.
+# Ex: [3, 4] -> [1, 5]
+def midpoint_index_array(lengths, include_last=False):
+    lengths = np.asarray(lengths, dtype='int64')
+    absolute_index = np.cumsum(lengths) - lengths + lengths // 2
+    if include_last:
+        absolute_index = np.append(absolute_index, lengths.sum() - 1)
+    return absolute_index
 
 # Returns the absolute index to the midpoint, counted from the start of the first range
 # Ex: [[3, 5, 6], [3, 1, 8, 7]] -> [1, 5]
 # TODO: Test with include last param
 def midpoint_absolute_index(ranges, include_last=False):
-    absolute_index = []
-    len_count = 0
-    for r in ranges:
-        mp_index = len(r) // 2
-        absolute_index.append(len_count + mp_index)
-        len_count += len(r)
-    if include_last:
-        absolute_index.append(len_count - 1)
-    return absolute_index
+    return midpoint_index_array(range_lengths(ranges), include_last).tolist()
+
+# Same as start_end_absolute_index, but from the length of each range. Returns an array
+# with one row per range.
+# Ex: [3, 4] -> [[0, 2], [3, 6]]
+def start_end_index_array(lengths, overlap=0):
+    lengths = np.asarray(lengths, dtype='int64')
+    ends = np.cumsum(lengths)
+    return np.stack((ends - lengths, ends - 1 + overlap), axis=1)
 
 # Returns the absolute start and end index for each range, counted from the start of the first range
 # Ex: [[3, 5, 6], [3, 1, 8, 7]] -> [[0, 2], [3, 6]]
 # With overlap=1, the function returns:
 # Ex: [[3, 5, 6], [3, 1, 8, 7]] -> [[0, 3], [3, 7]]
 def start_end_absolute_index(ranges, overlap=0):
-    se_index = []
-    len_count = 0
-    for r in ranges:
-        se_index.append([len_count, len_count + len(r) - 1 + overlap])
-        len_count += len(r)
-    return se_index
+    return start_end_index_array(range_lengths(ranges), overlap).tolist()
 
 # Returns the index for each step between start and end for each range
 # Ex: [[0, 2], [3, 7]] -> [[0, 1, 2], [3, 4, 5, 6, 7]]
 def full_index(se_index):
-    full_index = []
-    len_count = 0
-    for r in se_index:
-        full_index.append([j for j in range(r[0], r[1] + 1)])
-        len_count += len(r)
-    return full_index
+    return [list(range(r[0], r[1] + 1)) for r in se_index]
+
+# Same as knot_index, but returns an array.
+def knot_index_array(ranges):
+    ranges = np.asarray(ranges)
+    if len(ranges) < 2:
+        raise ValueError('There must be at least 2 ranges in the list')
+    return (ranges[:-1, -1] + ranges[1:, 0]) // 2
 
 # Returns the middle value between two ranges for all ranges in a list of ranges
 # Ex: [[1, 2],[2, 6], [6, 10]] -> [2, 6]
 def knot_index(ranges):
     if len(ranges) < 2:
         raise ValueError('There must be at least 2 ranges in the list')
-    knots = []
-    for i in range(0, len(ranges[:-1])):
-        knots.append((ranges[i][-1] + ranges[i + 1][0]) // 2)
-    return knots
+    return [(ranges[i][-1] + ranges[i + 1][0]) // 2 for i in range(0, len(ranges) - 1)]
 
-def get_ranges(start_date, prices):
+# Same as get_ranges, but returns the PeriodAxis and the price of each date as an array.
+def get_axis(start_date, prices, resolution='D', tz=None):
     if len(prices) < 2:
         raise ValueError('The price list must contain at least 2 values')
-    dr = date_ranges(start_date, len(prices) - 2)
+    period = period_axis(start_date, strip_eoms(start_date, len(prices)), resolution=resolution, tz=tz)
+    return period, price_array(period.lengths, prices)
+
+# Splits the dates of a PeriodAxis and the price of each date into one array view per
+# period. Returns the same as get_ranges, but with arrays instead of lists.
+def axis_arrays(period_axis, y):
+    x = period_axis.dates
+    dr = np.split(x, period_axis.starts[1:])
+    pr = np.split(y, period_axis.starts[1:])
+    return x, y, dr, pr
+
+# Same as get_ranges, but returns arrays that are built without any per date Python objects.
+def get_arrays(start_date, prices, resolution='D', tz=None):
+    period, y = get_axis(start_date, prices, resolution, tz)
+    return axis_arrays(period, y)
+
+def get_ranges(start_date, prices, resolution='D', tz=None):
+    period, y = get_axis(start_date, prices, resolution, tz)
+    dr = axis_ranges(period)
     x = flatten_ranges(dr)
-    pr = price_ranges(dr, prices)
-    y = flatten_ranges(pr)
+    y = y.tolist()
+    pr = [y[s:s + l] for s, l in zip(period.starts.tolist(), period.lengths.tolist())]
     return x, y, dr, pr
@@ -0,0 +1,83 @@
+import functools
+import numpy as np
+from curvy import axis, builder, profiling, storage
+from curvy.curve import Curve
+
+# Backfills curves for many trading dates. The KKT system in local coordinates only
+# depends on the number of steps in each period, so trading dates with the same period
+# lengths (e.g. the same day of the month in different years) share one factorization,
+# and their prices are solved together as one batch.
+
+# Maximum number of factorizations kept by signature_factorization.
+SIGNATURE_CACHE_SIZE = 1024
+
+# Returns the first step (see axis.bounds_offsets) and the number of steps in each period
+# for a strip of num_periods prices on the trading date, with the same periods as
+# builder.get_plan (see axis.strip_eoms).
+def date_signature(start_date, num_periods, resolution='D', tz=None):
+    bounds = axis.period_bounds(start_date, axis.strip_eoms(start_date, num_periods))
+    first, offsets = axis.bounds_offsets(bounds, resolution, tz)
+    return first, tuple(np.diff(offsets).tolist())
+
+# Returns the taus and the factorized system for the period lengths (a tuple), from a
+# least recently used cache of the last SIGNATURE_CACHE_SIZE signatures.
+@functools.lru_cache(maxsize=SIGNATURE_CACHE_SIZE)
+def signature_factorization(lengths, exact_avg=False):
+    taus = axis.start_end_index_array(np.array(lengths, dtype='int64'), overlap=1)
+    return taus, builder.KKTFactorization(axis.knot_index_array(taus), taus, exact_avg, local=True)
+
+# Groups the positions of the trading dates by their signature. Returns the first step of
+# each date, the signature of each date and {signature: [positions]}.
+def group_dates(dates, num_periods, resolution='D', tz=None):
+    firsts = []
+    signatures = []
+    groups = {}
+    for i, (start_date, n) in enumerate(zip(dates, num_periods)):
+        first, lengths = date_signature(start_date, n, resolution, tz)
+        firsts.append(first)
+        signatures.append(lengths)
+        groups.setdefault(lengths, []).append(i)
+    return firsts, signatures, groups
+
+# Solves the curve parameters (in local coordinates) for a strip of prices on each trading
+# date, batch_size dates of the same signature at a time. Returns the first step and the
+# signature of each date, the parameters of each date and the number of signatures.
+def solve_dates(dates, prices, corr_avg=False, resolution='D', tz=None, batch_size=1024):
+    if len(dates) != len(prices):
+        raise ValueError('There must be one price strip per date')
+    dates = np.asarray(dates, dtype='datetime64[D]').tolist()
+    firsts, signatures, groups = group_dates(dates, [len(p) for p in prices], resolution, tz)
+    params = [None] * len(dates)
+    for lengths, positions in groups.items():
+        taus, kkt = signature_factorization(lengths, corr_avg)
+        for start in range(0, len(positions), batch_size):
+            batch = positions[start:start + batch_size]
+            B = builder.calc_batch_B(np.array([prices[i] for i in batch], dtype='float64'), taus, local=True)
+            X = kkt.solve(B)
+            for j, i in enumerate(batch):
+                params[i] = X[:, j]
+    return firsts, signatures, params, len(groups)
+
+# Builds the curve for a strip of prices on each trading date and appends them, in date
+# order, to the curve archive at path (see storage.CurveArchive). Each curve is stored
+# with its prices and the date as key, so it can be read back with archive['2018-11-26'].
+# Returns the number of curves and of distinct signatures (factorizations).
+# Ex:
+# backfill.backfill(trading_dates, price_strips, 'history.crvy')
+def backfill(dates, prices, path, corr_avg=False, resolution='D', tz=None, batch_size=1024, metadata=None):
+    with profiling.build('backfill'):
+        firsts, signatures, params, num_signatures = solve_dates(dates, prices, corr_avg, resolution, tz,
+                                                                 batch_size)
+        step = axis.resolution_step(resolution)
+        keys = np.datetime_as_string(np.asarray(dates, dtype='datetime64[D]')).tolist()
+        base = dict(metadata or {}, resolution=resolution, tz=tz, corr_avg=corr_avg)
+
+        def records():
+            for i, key in enumerate(keys):
+                breakpoints = np.concatenate(([0], np.cumsum(signatures[i])))
+                yield Curve(params[i], breakpoints, firsts[i], step), prices[i], key, base
+
+        with profiling.stage('write', num_curves=len(keys)):
+            with storage.CurveArchive(path) as archive:
+                archive.extend(records())
+        return {'curves': len(keys), 'signatures': num_signatures}
@@ -1,118 +1,669 @@
+import functools
 import numpy as np
-import numpy.matlib as npm
-from scipy.linalg import block_diag
-from curvy import axis
+from curvy import axis, profiling
 from datetime import datetime
 
+# All matrices are assembled in bulk from tables of powers of tau_b, tau_e and the knots.
+# The coefficient and exponent tables below describe the non-zero part of one H block,
+# and the three continuity constraint rows (value, 1st and 2nd derivative) at a knot.
+H_COEFS = np.array([[144 / 5, 18, 8], [18, 12, 6], [8, 6, 4]])
+H_POWERS = np.array([[5, 4, 3], [4, 3, 2], [3, 2, 1]])
+CONSTRAINT_COEFS = np.array([[1, 1, 1, 1, 1], [4, 3, 2, 1, 0], [12, 6, 2, 0, 0]])
+CONSTRAINT_POWERS = np.array([[4, 3, 2, 1, 0], [3, 2, 1, 0, 0], [2, 1, 0, 0, 0]])
+
+# Returns a table with the powers 0 to degree of each value, in float64 to avoid integer
+# overflow for large indices.
+# Ex: [2, 3] -> [[1, 2, 4], [1, 3, 9]] (degree=2)
+def power_table(values, degree=5):
+    return np.asarray(values, dtype='float64')[..., None] ** np.arange(degree + 1)
+
+# Returns tau_e**k - tau_b**k for k = 0 to degree, one row per tau.
+def _power_diffs(taus, degree=5):
+    powers = power_table(np.reshape(taus, (-1, 2)), degree)
+    return powers[:, 1] - powers[:, 0]
+
+# Returns the H matrix of each segment stacked into an array of shape (n, 5, 5).
+def calc_H_blocks(taus):
+    diffs = _power_diffs(taus)
+    H = np.zeros((len(diffs), 5, 5))
+    H[:, :3, :3] = H_COEFS * diffs[:, H_POWERS]
+    return H
+
 def calc_H(tau_b, tau_e):
-    return np.matrix([
-        [(144 / 5) * (tau_e**5 - tau_b**5),    18 * (tau_e**4 - tau_b**4),    8 * (tau_e**3 - tau_b**3), 0, 0],
-        [       18 * (tau_e**4 - tau_b**4),    12 * (tau_e**3 - tau_b**3),    6 * (tau_e**2 - tau_b**2), 0, 0],
-        [        8 * (tau_e**3 - tau_b**3),     6 * (tau_e**2 - tau_b**2),    4 * (tau_e**1 - tau_b**1), 0, 0],
-        [                   0,                0,               0, 0, 0],
-        [                   0,                0,               0, 0, 0],
-    ])
+    return calc_H_blocks([[tau_b, tau_e]])[0]
+
+# Returns the row and column index of every element in the block diagonal matrix with
+# one (num_rows x num_cols) block per segment, offset by row_step and col_step.
+def _block_index(num_blocks, num_rows, num_cols, row_step, col_step):
+    blocks = np.arange(num_blocks)[:, None, None]
+    rows = row_step * blocks + np.arange(num_rows)[None, :, None]
+    cols = col_step * blocks + np.arange(num_cols)[None, None, :]
+    return np.broadcast_to(rows, (num_blocks, num_rows, num_cols)), np.broadcast_to(cols, (num_blocks, num_rows, num_cols))
+
+# Segment-local coordinates: with local=True, each segment is written as a polynomial in
+# s = (u - tau_b) / (tau_e - tau_b) instead of the absolute index u. s runs from 0 to 1
+# over each segment, so the powers of s stay small no matter how far from the start of
+# the curve the segment is. This keeps the KKT system well conditioned for long and
+# fine-resolution curves, where u**5 would otherwise reach 10**25.
+
+# Returns the origin (tau_b) and scale (tau_e - tau_b) of the local coordinates of each segment.
+def segment_frames(taus):
+    taus = np.reshape(np.asarray(taus, dtype='float64'), (-1, 2))
+    return taus[:, 0], taus[:, 1] - taus[:, 0]
+
+# Returns the taus shifted to start at 0, and the factor between each parameter in the
+# shifted and in the local coordinates (scale**-4, scale**-3, ..., 1), one row per segment.
+def _local_frames(taus):
+    origins, scales = segment_frames(taus)
+    return np.stack((np.zeros(len(scales)), scales), axis=1), power_table(1 / scales, 4)[:, ::-1]
 
-def calc_big_H(taus):
-    h_matrices = []
-    for i in range(0, len(taus)):
-        tau_b, tau_e = taus[i]
-        h_matrices.append(calc_H(tau_b, tau_e))
-    return block_diag(*h_matrices)
+# Returns the H matrix of each segment in local coordinates, shape (n, 5, 5). The blocks
+# are scaled by the cube of the shortest segment length, which balances them against the
+# constraints without changing the solution.
+def calc_local_H_blocks(taus):
+    origins, scales = segment_frames(taus)
+    shifted, factors = _local_frames(taus)
+    return calc_H_blocks(shifted) * factors[:, :, None] * factors[:, None, :] * scales.min()**3
+
+def calc_big_H(taus, local=False):
+    blocks = calc_local_H_blocks(taus) if local else calc_H_blocks(taus)
+    H = np.zeros((5 * len(blocks), 5 * len(blocks)))
+    H[_block_index(len(blocks), 5, 5, 5, 5)] = blocks
+    return H
+
+# Returns the average constraint of each segment, one row per segment.
+def calc_avg_constraints(taus):
+    return _power_diffs(taus)[:, :0:-1] / np.arange(5, 0, -1)
 
 def calc_avg_constraint(tau_b, tau_e):
-    return np.matrix([(tau_e**5 - tau_b**5) / 5, (tau_e**4 - tau_b**4) / 4, (tau_e**3 - tau_b**3) / 3, (tau_e**2 - tau_b**2) / 2, tau_e - tau_b])
+    return calc_avg_constraints([[tau_b, tau_e]])
+
+# Returns sum(u**k for u in range(tau_b, tau_e)) for k = 0 to 4, one row per tau. Uses the
+# closed form sums of j**k over j = 0 to n - 1 and the binomial expansion of (tau_b + j)**k.
+def power_sums(taus):
+    taus = np.reshape(np.asarray(taus, dtype='float64'), (-1, 2))
+    n = taus[:, 1] - taus[:, 0]
+    m = n - 1
+    sums = np.stack((
+        n,
+        m * n / 2,
+        m * n * (2 * m + 1) / 6,
+        (m * n / 2)**2,
+        m * n * (2 * m + 1) * (3 * m**2 + 3 * m - 1) / 30
+    ), axis=1)
+    offsets = power_table(taus[:, 0], 4)
+    binomials = [[1], [1, 1], [1, 2, 1], [1, 3, 3, 1], [1, 4, 6, 4, 1]]
+    return np.stack([
+        sum(c * offsets[:, k - j] * sums[:, j] for j, c in enumerate(binomials[k]))
+        for k in range(0, 5)
+    ], axis=1)
+
+# Returns the discrete average constraint of each segment, one row per segment. Where
+# calc_avg_constraints keeps the integral of each segment, this keeps the sum of the curve
+# values at tau_b, tau_b + 1, ..., tau_e - 1. The mean of the curve values in each range
+# is then exactly the forward price.
+def calc_discrete_avg_constraints(taus):
+    return power_sums(taus)[:, ::-1]
+
+# Returns the continuity constraints at each knot stacked into an array of shape (n, 3, 5).
+def calc_knot_constraints(knots):
+    return CONSTRAINT_COEFS * power_table(np.ravel(knots), 4)[:, CONSTRAINT_POWERS]
 
 def calc_constraints(u_j):
     # Using the four contraints: connectivity, continuous, smooth and maintaining the average.
     # Excluding the requirement for the line to be zero at the end.
-    return np.matrix([
-        [     u_j**4,     u_j**3,     u_j**2, u_j**1,   1],
-        [ 4 * u_j**3, 3 * u_j**2, 2 * u_j**1,      1,   0],
-        [12 * u_j**2, 6 * u_j**1,          2,      0,   0]
-    ])
+    return calc_knot_constraints([u_j])[0]
+
+# Returns the continuity constraints on the segment before (left) and after (right) each
+# knot, and the average constraint of each segment. In absolute coordinates the right
+# constraints are just the left ones with opposite sign. In local coordinates the rows are
+# also scaled so the derivatives are taken in the units of the neighbouring segments, and
+# the average constraints are divided by the segment length so the average is kept
+# directly (see calc_B).
+def calc_A_blocks(knots, taus, exact_avg=False, local=False):
+    avg_constraints = calc_discrete_avg_constraints if exact_avg else calc_avg_constraints
+    if not local:
+        left = calc_knot_constraints(knots)
+        return left, -left, avg_constraints(taus)
+    origins, scales = segment_frames(taus)
+    shifted, factors = _local_frames(taus)
+    knots = np.asarray(knots, dtype='float64')
+    row_scales = power_table((scales[:-1] + scales[1:]) / 2, 2)[:, :, None]
+    left = calc_knot_constraints(knots - origins[:-1]) * factors[:-1, None, :] * row_scales
+    right = -calc_knot_constraints(knots - origins[1:]) * factors[1:, None, :] * row_scales
+    return left, right, avg_constraints(shifted) * factors / scales[:, None]
+
+# Returns the row index in A (and B) of the average constraint of each segment.
+def avg_constraint_rows(num_segments):
+    return np.append(np.arange(3, 4 * num_segments - 4, 4), 4 * num_segments - 4)
+
+# Returns the row index, column index and value of every non-zero element in A.
+# With exact_avg=True, the average constraints are the discrete ones from
+# calc_discrete_avg_constraints.
+def calc_A_entries(knots, taus, exact_avg=False, local=False):
+    n = len(taus)
+    left, right, c2 = calc_A_blocks(knots, taus, exact_avg, local)
+    c1_rows, c1_cols = _block_index(n - 1, 3, 5, 4, 5)
+    c2_rows = np.broadcast_to(avg_constraint_rows(n)[:, None], c2.shape)
+    c2_cols = 5 * np.arange(n)[:, None] + np.arange(5)
+    rows = np.concatenate((c1_rows.ravel(), c1_rows.ravel(), c2_rows.ravel()))
+    cols = np.concatenate((c1_cols.ravel(), c1_cols.ravel() + 5, c2_cols.ravel()))
+    values = np.concatenate((left.ravel(), right.ravel(), c2.ravel()))
+    return rows, cols, values
 
-def calc_big_A(knots, taus):
-    A = npm.zeros((4 * len(knots) + 1, 5 * len(knots) + 5))
-    for i, knot in enumerate(knots):
-        tau_b, tau_e = taus[i]
-        c1 = calc_constraints(knot)
-        c2 = calc_avg_constraint(tau_b, tau_e)
-        A[(4 * i):(4 * i + 3), (5 * i):(5 * i + 5)] = c1
-        A[(4 * i):(4 * i + 3), (5 * i + 5):(5 * i + 10)] = - c1
-        A[(4 * i + 3), (5 * i):(5 * i + 5)] = c2
-    # Last line only subject to the average constraint.
-    tau_b, tau_e = taus[-1]
-    A[-1, -5:] = calc_avg_constraint(tau_b, tau_e)
+def calc_big_A(knots, taus, exact_avg=False, local=False):
+    rows, cols, values = calc_A_entries(knots, taus, exact_avg, local)
+    A = np.zeros((4 * len(taus) - 3, 5 * len(taus)))
+    A[rows, cols] = values
     return A
 
-def calc_B(prices, taus):
-    B = npm.zeros(4 * len(taus) - 3)
-    for i in range(0, len(taus) - 1):
-        tau_b, tau_e = taus[i]
-        B[:, 4 * i + 3] = prices[i] * (tau_e - tau_b)
-    tau_b, tau_e = taus[-1]
-    B[:, -1] = prices[-1] * (tau_e - tau_b)
-    return B.T
+# In local coordinates, the average constraints keep the average instead of the integral,
+# so B holds the prices themselves.
+def calc_B(prices, taus, local=False):
+    return calc_batch_B([prices], taus, local)
+
+# Same as calc_B, but for a matrix with one row of prices per curve. Returns B with one
+# column per curve.
+def calc_batch_B(prices, taus, local=False):
+    prices = np.asarray(prices, dtype='float64')
+    if prices.ndim != 2 or prices.shape[1] != len(taus):
+        raise ValueError('The prices need to be a matrix with one column per range')
+    lengths = 1 if local else _power_diffs(taus, 1)[:, 1]
+    B = np.zeros((4 * len(taus) - 3, prices.shape[0]))
+    B[avg_constraint_rows(len(taus))] = (prices * lengths).T
+    return B
+
+# Splits the x-matrix into a list of numpy arrays, each containing the a, b, c, d and e
+# variables for each line segment.
+def split_params(X, num_params=5):
+    if X.shape[0] % num_params != 0:
+        raise ValueError('The split of the x-matrix is not even. Set "num_params" to the correct value to fix this')
+    return np.split(X, np.arange(num_params, X.shape[0], num_params))
 
 # Solves the linear equation and return only the x values (scraps lambda).
 # By default it splits the x-matrix into a list of numpy arrays, each containing
 # the a, b, c, d and e variables for each line segment.
 def solve_lineq(H, A, B, split=True, num_params=5):
-    top = np.concatenate((2 * H, A.T), axis=1)
-    btm = np.concatenate((A, np.zeros((A.shape[0], A.T.shape[1]))), axis=1)
-    A_merged = np.concatenate((top, btm), axis=0)
-    B_merged = np.concatenate(
-        (
-            npm.zeros(top.shape[1] - B.shape[0]).T,
-            B
-        ), axis=0)
-    X = np.squeeze(np.array(np.linalg.solve(A_merged,B_merged)[:A.shape[1]]))
+    A_merged = np.block([
+        [2 * np.asarray(H), np.asarray(A).T],
+        [np.asarray(A), np.zeros((A.shape[0], A.shape[0]))]
+    ])
+    B_merged = np.concatenate((np.zeros(A.shape[1]), np.ravel(B)))
+    X = np.linalg.solve(A_merged, B_merged)[:A.shape[1]]
+    if split:
+        return split_params(X, num_params)
+    else:
+        return X
+
+# Number of sub- and super-diagonals of the KKT system in band order.
+KKT_BANDWIDTH = 8
+
+# Returns the position of each KKT variable (the x values followed by lambda) when the
+# parameters of every segment are interleaved with the multipliers of the constraints
+# it starts. In this order the KKT system is banded with KKT_BANDWIDTH sub- and
+# super-diagonals, no matter the number of segments.
+# Ex: 2 segments -> x: [0, 1, 2, 3, 4, 9, 10, 11, 12, 13], lambda: [5, 6, 7, 8, 14]
+def kkt_band_order(num_segments):
+    x_order = 9 * np.repeat(np.arange(num_segments), 5) + np.tile(np.arange(5), num_segments)
+    rows = np.arange(4 * num_segments - 3)
+    lambda_order = 9 * (rows // 4) + 5 + rows % 4
+    return np.concatenate((x_order, lambda_order))
+
+# Builds the KKT system of H and A directly in banded storage (as used by
+# scipy.linalg.solve_banded). Memory and time are linear in the number of segments, as
+# neither H nor A is formed.
+def calc_banded_kkt(knots, taus, exact_avg=False, local=False):
+    n = len(taus)
+    order = kkt_band_order(n)
+    ab = np.zeros((2 * KKT_BANDWIDTH + 1, 9 * n - 3))
+    H_rows, H_cols = _block_index(n, 5, 5, 5, 5)
+    H_rows, H_cols = order[H_rows.ravel()], order[H_cols.ravel()]
+    H_blocks = calc_local_H_blocks(taus) if local else calc_H_blocks(taus)
+    ab[KKT_BANDWIDTH + H_rows - H_cols, H_cols] = 2 * H_blocks.ravel()
+    A_rows, A_cols, A_values = calc_A_entries(knots, taus, exact_avg, local)
+    A_rows, A_cols = order[5 * n + A_rows], order[A_cols]
+    ab[KKT_BANDWIDTH + A_rows - A_cols, A_cols] = A_values
+    ab[KKT_BANDWIDTH + A_cols - A_rows, A_rows] = A_values
+    return ab
+
+# LU factorization of the banded KKT system. The system only depends on the date structure
+# (knots and taus), while the prices only enter the right hand side B. One factorization
+# can therefore be reused to solve for any number of price vectors.
+# scipy is only imported when the first system is factorized, so importing curvy only
+# needs numpy.
+def _lapack():
+    from scipy.linalg import lapack
+    return lapack
+
+class KKTFactorization:
+    def __init__(self, knots, taus, exact_avg=False, local=False):
+        self.num_segments = len(taus)
+        self.exact_avg = exact_avg
+        self.local = local
+        self.order = kkt_band_order(self.num_segments)
+        num_rows = len(self.order)
+        with profiling.stage('assembly', num_segments=self.num_segments, shape=(num_rows, num_rows)):
+            ab = calc_banded_kkt(knots, taus, exact_avg, local)
+            # The 1-norm of the system, for the condition number estimate.
+            self.norm = np.abs(ab).sum(axis=0).max()
+            # LAPACK needs KKT_BANDWIDTH extra rows on top for the fill-in from pivoting.
+            ab = np.concatenate((np.zeros((KKT_BANDWIDTH, ab.shape[1])), ab), axis=0)
+        with profiling.stage('factorize', num_segments=self.num_segments, shape=ab.shape):
+            self.lu, self.piv, info = _lapack().dgbtrf(ab, KKT_BANDWIDTH, KKT_BANDWIDTH, overwrite_ab=1)
+        if info > 0:
+            raise np.linalg.LinAlgError('The KKT system is singular')
+
+    # Returns an estimate of the condition number (in the 1-norm) of the KKT system. The
+    # number of accurate digits in the solution is roughly 16 - log10 of this.
+    def condition_number(self):
+        rcond, info = _lapack().dgbcon(KKT_BANDWIDTH, KKT_BANDWIDTH, self.lu, self.piv, self.norm)
+        return np.inf if rcond == 0 else 1 / rcond
+
+    # Solves for the x values given B. B can be a single column or have one column per
+    # price vector, in which case X has one column per price vector as well.
+    def solve(self, B):
+        B = np.asarray(B, dtype='float64')
+        num_x = 5 * self.num_segments
+        with profiling.stage('solve', num_segments=self.num_segments, shape=B.shape):
+            B_merged = np.zeros((self.lu.shape[1],) + B.shape[1:])
+            B_merged[self.order[num_x:]] = B
+            Z, info = _lapack().dgbtrs(self.lu, KKT_BANDWIDTH, KKT_BANDWIDTH, B_merged, self.piv)
+        return Z[self.order[:num_x]]
+
+# Solves the same linear equation as solve_lineq, but from the knots and taus using a
+# banded factorization of the KKT system. Gives the same result as the dense path in
+# linear time and memory, which matters for curves with thousands of segments.
+def solve_banded_lineq(knots, taus, B, split=True, num_params=5, exact_avg=False, local=False):
+    X = KKTFactorization(knots, taus, exact_avg, local).solve(np.ravel(B))
     if split:
-        if X.shape[0] % num_params != 0:
-            raise ValueError('The split of the x-matrix is not even. Set "num_params" to the correct value to fix this')
-        return np.split(X, np.arange(num_params, X.shape[0], num_params))
+        return split_params(X, num_params)
     else:
         return X
 
 def smfc(u, params):
     return params[0] * u**4 + params[1] * u**3 + params[2] * u**2 + params[3] * u + params[4]
 
-def curve_values(ranges, X, curve_func, flatten=False):
-    if len(ranges) != len(X):
+# With local=True, X is in segment-local coordinates (see segment_frames) and each curve
+# function is evaluated at s = 0, 1 / n, ..., (n - 1) / n for a range with n steps.
+def curve_values(ranges, X, curve_func, flatten=False, local=False):
+    return segment_values(axis.range_lengths(ranges), X, curve_func, flatten=flatten, local=local)
+
+# Same as curve_values, but from the number of steps in each range.
+def segment_values(lengths, X, curve_func, flatten=False, local=False):
+    if len(lengths) != len(X):
         raise ValueError('Arrays do not match in length')
-    ranges_se = axis.start_end_absolute_index(ranges)
-    x_index = axis.full_index(ranges_se)
-    x_ranges = []
-    for i, r in enumerate(x_index):
-        x_ranges.append(curve_func(np.array(r, dtype='int64'), X[i]))
-    if flatten:
-        return np.concatenate(x_ranges)
-    else:
-        return x_ranges
-
-def calc_smfc(dr, prices, flatten=True):
-    taus = axis.start_end_absolute_index(dr, overlap=1)
-    knots = axis.knot_index(taus)
-    H = calc_big_H(taus)
-    A = calc_big_A(knots, taus)
-    B = calc_B(prices, taus)
-    X = solve_lineq(H, A, B)
-    return curve_values(dr, X, smfc, flatten=flatten)
-
-def build_smfc_curve(prices, start_date=None, flatten=True, corr_avg=False):
+    ranges_se = axis.start_end_index_array(lengths).tolist()
+    with profiling.stage('evaluate', num_segments=len(ranges_se), num_steps=ranges_se[-1][1] + 1):
+        x_ranges = []
+        for i, (start, end) in enumerate(ranges_se):
+            if local:
+                u = np.arange(0, end - start + 1, dtype='float64') / (end - start + 1)
+            else:
+                u = np.arange(start, end + 1, dtype='float64')
+            x_ranges.append(curve_func(u, X[i]))
+        if flatten:
+            return np.concatenate(x_ranges)
+        else:
+            return x_ranges
+
+# Evaluates the curve for a batch of curves at once. X has one column of parameters per
+# curve (as returned by KKTFactorization.solve) and the result has one row per curve.
+def batch_curve_values(ranges, X, num_params=5, local=False, out=None, chunk_size=None):
+    return batch_segment_values(axis.range_lengths(ranges), X, num_params, local, out, chunk_size)
+
+# Writes the values of the curves for the steps start to stop - 1 into out, which has one
+# row per column in X. Only the segments overlapping the steps are evaluated.
+def _evaluate_block(ranges_se, X, start, stop, out, num_params=5, local=False):
+    powers = np.arange(num_params - 1, -1, -1)[:, None]
+    i = np.searchsorted(ranges_se[:, 1], start)
+    while i < len(ranges_se) and ranges_se[i, 0] < stop:
+        seg_start, seg_end = ranges_se[i]
+        u = np.arange(max(seg_start, start), min(seg_end + 1, stop), dtype='float64')
+        values = out[:, int(u[0]) - start:int(u[-1]) + 1 - start]
+        if local:
+            u = (u - seg_start) / (seg_end - seg_start + 1)
+        np.matmul(X[num_params * i:num_params * (i + 1)].T, u ** powers, out=values)
+        i += 1
+
+# Same as batch_curve_values, but from the number of steps in each range. The values can
+# be written into a preallocated (num_curves, num_steps) out array, e.g. a numpy.memmap.
+# With a chunk_size, at most chunk_size steps are evaluated at a time, which bounds the
+# memory used on top of out.
+def batch_segment_values(lengths, X, num_params=5, local=False, out=None, chunk_size=None):
+    ranges_se = axis.start_end_index_array(lengths)
+    if X.shape[0] != num_params * len(ranges_se):
+        raise ValueError('Arrays do not match in length')
+    num_steps = int(ranges_se[-1, 1]) + 1
+    if out is None:
+        out = np.empty((X.shape[1], num_steps))
+    elif out.shape != (X.shape[1], num_steps):
+        raise ValueError('The out array must have the shape {}'.format((X.shape[1], num_steps)))
+    chunk_size = chunk_size or num_steps
+    with profiling.stage('evaluate', num_segments=len(ranges_se), num_steps=num_steps, num_curves=X.shape[1]):
+        for start in range(0, num_steps, chunk_size):
+            stop = min(start + chunk_size, num_steps)
+            _evaluate_block(ranges_se, X, start, stop, out[:, start:stop], num_params, local)
+    return out
+
+# Evaluates the curve (or a batch of curves, with one column of parameters per curve in X)
+# chunk_size steps at a time, and yields the slice of steps and the values for each chunk.
+def iter_segment_values(lengths, X, chunk_size=65536, num_params=5, local=False):
+    X = np.asarray(X, dtype='float64')
+    batch = X.reshape(X.shape[0], -1)
+    ranges_se = axis.start_end_index_array(lengths)
+    if batch.shape[0] != num_params * len(ranges_se):
+        raise ValueError('Arrays do not match in length')
+    num_steps = int(ranges_se[-1, 1]) + 1
+    for start in range(0, num_steps, chunk_size):
+        stop = min(start + chunk_size, num_steps)
+        values = np.empty((batch.shape[1], stop - start))
+        _evaluate_block(ranges_se, batch, start, stop, values, num_params, local)
+        yield slice(start, stop), values[0] if X.ndim == 1 else values
+
+# Builds the smooth curve over the date ranges. With method='banded' (default) the KKT
+# system is solved in band form, method='dense' solves the full system with solve_lineq.
+# With exact_avg=True, the mean of the curve values in each range is exactly the price.
+# The system is set up in segment-local coordinates unless local=False.
+def calc_smfc(dr, prices, flatten=True, method='banded', exact_avg=False, local=True):
+    X = calc_smfc_params(dr, prices, method, exact_avg, local)
+    return curve_values(dr, X, smfc, flatten=flatten, local=local)
+
+# Same as calc_smfc, but returns the parameters of each segment instead of the curve values.
+def calc_smfc_params(dr, prices, method='banded', exact_avg=False, local=True):
+    if method not in ('banded', 'dense'):
+        raise ValueError('Unknown solver method "{}". Use "banded" or "dense"'.format(method))
+    taus = axis.start_end_index_array(axis.range_lengths(dr), overlap=1)
+    knots = axis.knot_index_array(taus)
+    B = calc_B(prices, taus, local)
+    if method == 'banded':
+        return solve_banded_lineq(knots, taus, B, exact_avg=exact_avg, local=local)
+    num_rows = 9 * len(taus) - 3
+    with profiling.stage('assembly', num_segments=len(taus), shape=(num_rows, num_rows)):
+        H = calc_big_H(taus, local)
+        A = calc_big_A(knots, taus, exact_avg, local)
+    with profiling.stage('solve', num_segments=len(taus), shape=(num_rows, num_rows)):
+        return solve_lineq(H, A, B)
+
+# Maximum number of plans kept by get_plan.
+PLAN_CACHE_SIZE = 64
+
+# Maximum number of influences kept by get_influence. Each one holds up to
+# INFLUENCE_DENSE_SIZE float64 values (32 MB), so only a few are kept.
+INFLUENCE_CACHE_SIZE = 4
+
+# Holds everything about a curve that only depends on its dates: the date ranges, taus,
+# knots and the factorized KKT system. A plan can be reused to build curves for any
+# prices with the same start date, number of periods, resolution and time zone.
+# The parameters from a plan are always in segment-local coordinates.
+# A plan for other periods than DA, BOM and EOM can be made by passing their PeriodAxis
+# (see products.product_plan).
+class CurvePlan:
+    def __init__(self, start_date, num_periods, resolution='D', tz=None, period_axis=None):
+        if num_periods < 2:
+            raise ValueError('The price list must contain at least 2 values')
+        self.start_date = start_date
+        self.num_periods = num_periods
+        self.resolution = resolution
+        self.tz = tz
+        if period_axis is None:
+            with profiling.stage('calendar', num_periods=num_periods):
+                num_eoms = axis.strip_eoms(start_date, num_periods)
+                period_axis = axis.period_axis(start_date, num_eoms, resolution=resolution, tz=tz)
+        self.axis = period_axis
+        # The dates are shared by all curves built from the plan.
+        self.axis.dates.flags.writeable = False
+        self.lengths = self.axis.lengths
+        if len(self.lengths) != num_periods:
+            raise ValueError('The number of date ranges and forwards prices need to be the same')
+        self.taus = axis.start_end_index_array(self.lengths, overlap=1)
+        self.knots = axis.knot_index_array(self.taus)
+        self.kkt = KKTFactorization(self.knots, self.taus, local=True)
+        self._exact_avg_kkt = None
+
+    # The date ranges as lists of datetime.date (or datetime.datetime), see axis.date_ranges.
+    @property
+    def dr(self):
+        return axis.axis_ranges(self.axis)
+
+    # Same as axis.get_ranges, but without recalculating the dates.
+    def get_ranges(self, prices):
+        if len(prices) != self.num_periods:
+            raise ValueError('The plan is for {} prices, got {}'.format(self.num_periods, len(prices)))
+        with profiling.stage('calendar', num_periods=self.num_periods):
+            x = self.axis.dates.tolist()
+            y = axis.price_array(self.lengths, prices).tolist()
+            ranges_se = axis.start_end_index_array(self.lengths).tolist()
+            dr = [x[s:e + 1] for s, e in ranges_se]
+            pr = [y[s:e + 1] for s, e in ranges_se]
+            return x, y, dr, pr
+
+    # Same as axis.get_arrays, but without recalculating the dates.
+    def get_arrays(self, prices):
+        if len(prices) != self.num_periods:
+            raise ValueError('The plan is for {} prices, got {}'.format(self.num_periods, len(prices)))
+        with profiling.stage('calendar', num_periods=self.num_periods):
+            return axis.axis_arrays(self.axis, axis.price_array(self.lengths, prices))
+
+    # Returns the factorized system, with the discrete average constraints if exact_avg
+    # is True. That one is only factorized the first time it is needed.
+    def factorization(self, exact_avg=False):
+        if not exact_avg:
+            return self.kkt
+        if self._exact_avg_kkt is None:
+            self._exact_avg_kkt = KKTFactorization(self.knots, self.taus, exact_avg=True, local=True)
+        return self._exact_avg_kkt
+
+    # Estimated condition number of the factorized system, see KKTFactorization.
+    def condition_number(self, exact_avg=False):
+        return self.factorization(exact_avg).condition_number()
+
+    # Returns the parameters of each segment. With a prices matrix (one row per curve),
+    # the result has one column of parameters per curve.
+    def solve(self, prices, exact_avg=False):
+        prices = np.asarray(prices, dtype='float64')
+        kkt = self.factorization(exact_avg)
+        if prices.ndim == 1:
+            return kkt.solve(calc_B(prices, self.taus, local=True)[:, 0])
+        return kkt.solve(calc_batch_B(prices, self.taus, local=True))
+
+    # Returns the parameters for a price of 1 in the given period and 0 in all others. The
+    # parameters are linear in the prices, so changing one price by delta changes the
+    # parameters by delta times this. The solution is not kept by the plan, so plans in the
+    # plan cache stay small (LiveCurve keeps the ones it uses).
+    def unit_solution(self, period_index, exact_avg=False):
+        prices = np.zeros(self.num_periods)
+        prices[period_index] = 1
+        return self.solve(prices, exact_avg)
+
+    # Returns a new PriceInfluence of the plan. It is not kept by the plan, so plans in the
+    # plan cache stay small. Use get_influence for a cached one.
+    def influence(self, exact_avg=False):
+        return PriceInfluence(self, exact_avg)
+
+    # Same as calc_smfc for the date ranges of the plan.
+    def calc_smfc(self, prices, flatten=True, exact_avg=False):
+        X = split_params(self.solve(prices, exact_avg))
+        return segment_values(self.lengths, X, smfc, flatten=flatten, local=True)
+
+# Largest number of entries (curve steps times periods) of an influence matrix that is
+# stored densely. Larger ones are kept in factored form, see PriceInfluence.
+INFLUENCE_DENSE_SIZE = 2**22
+
+# Returns the weights that give the mean of the curve values in each segment from the
+# parameters in local coordinates, one row per segment. Uses the sums of s**k over
+# s = 0, 1 / n, ..., (n - 1) / n for a segment with n steps.
+def local_mean_weights(lengths):
+    lengths = np.asarray(lengths, dtype='float64')
+    sums = power_sums(np.stack((np.zeros(len(lengths)), lengths), axis=1))
+    return (sums * power_table(1 / lengths, 4) / lengths[:, None])[:, ::-1]
+
+# The curve is a linear function of the prices, so it is the influence matrix (one column
+# per period, one row per curve step) times the prices. The parameters for a price of 1 in
+# each period are solved at once, and the matrix is stored densely if it has at most
+# INFLUENCE_DENSE_SIZE entries. Otherwise it is kept in factored form as the parameters,
+# and the curve values are evaluated from them when needed. The matrix from the prices to
+# the mean of the curve in each period is always small, and is stored densely.
+# Ex:
+# influence = get_plan(start_date, len(prices)).influence()
+# influence.curve(prices)      # Same as the curve values from build_smfc_curve
+# influence.matrix()[:, 3]     # Change in the curve per change in the 4th price
+class PriceInfluence:
+    def __init__(self, plan, exact_avg=False, max_dense_size=INFLUENCE_DENSE_SIZE):
+        self.lengths = plan.lengths
+        self.num_periods = plan.num_periods
+        self.num_steps = int(plan.lengths.sum())
+        self.params = plan.solve(np.eye(self.num_periods), exact_avg)
+        self.params.flags.writeable = False
+        weights = local_mean_weights(self.lengths)
+        self.averages = (self.params.reshape(self.num_periods, 5, -1) * weights[:, :, None]).sum(axis=1)
+        self.averages.flags.writeable = False
+        self.dense = self.num_steps * self.num_periods <= max_dense_size
+        self._matrix = None
+        if self.dense:
+            self._matrix = batch_segment_values(self.lengths, self.params, local=True).T
+            self._matrix.flags.writeable = False
+
+    # Returns the influence matrix, shape (num_steps, num_periods). In factored form, the
+    # matrix is evaluated (and not kept) on each call.
+    def matrix(self):
+        if self._matrix is not None:
+            return self._matrix
+        return batch_segment_values(self.lengths, self.params, local=True).T
+
+    # Returns the curve values for the prices. With a prices matrix (one row per curve),
+    # the result has one row of curve values per curve.
+    def curve(self, prices):
+        prices = np.asarray(prices, dtype='float64')
+        if prices.shape[-1] != self.num_periods:
+            raise ValueError('The influence is for {} prices, got {}'.format(self.num_periods, prices.shape[-1]))
+        if self._matrix is not None:
+            return prices @ self._matrix.T
+        values = batch_segment_values(self.lengths, self.params @ prices.reshape(-1, self.num_periods).T, local=True)
+        return values[0] if prices.ndim == 1 else values
+
+    # Returns the mean of the curve in each period for the prices (or prices matrix).
+    def period_averages(self, prices):
+        return np.asarray(prices, dtype='float64') @ self.averages.T
+
+@functools.lru_cache(maxsize=PLAN_CACHE_SIZE)
+def _cached_plan(start_date, num_periods, resolution, tz):
+    return CurvePlan(start_date, num_periods, resolution, tz)
+
+# Returns the plan for the start date and number of periods, from a least recently used
+# cache of the last PLAN_CACHE_SIZE plans. Only the date of start_date is part of the key.
+def get_plan(start_date, num_periods, resolution='D', tz=None):
+    start_date = datetime(start_date.year, start_date.month, start_date.day)
+    return _cached_plan(start_date, num_periods, resolution, tz)
+
+# Returns the hits, misses, maximum size and current size of the plan cache.
+def plan_cache_info():
+    return _cached_plan.cache_info()
+
+def clear_plan_cache():
+    _cached_plan.cache_clear()
+
+@functools.lru_cache(maxsize=INFLUENCE_CACHE_SIZE)
+def _cached_influence(start_date, num_periods, resolution, tz, exact_avg):
+    return get_plan(start_date, num_periods, resolution, tz).influence(exact_avg)
+
+# Returns the PriceInfluence for the start date and number of periods, from a least
+# recently used cache of the last INFLUENCE_CACHE_SIZE influences. Only the date of
+# start_date is part of the key.
+def get_influence(start_date, num_periods, resolution='D', tz=None, exact_avg=False):
+    start_date = datetime(start_date.year, start_date.month, start_date.day)
+    return _cached_influence(start_date, num_periods, resolution, tz, bool(exact_avg))
+
+def clear_influence_cache():
+    _cached_influence.cache_clear()
+
+# The plan (dates and factorized system) is taken from the plan cache when method is
+# 'banded', so building many curves on the same start date only solves for the prices.
+# With corr_avg=True the mean of the curve in each period is exactly the forward price,
+# as the average constraints are kept for the discrete curve values (see exact_avg).
+# The resolution ('D', 'h', '30min' or '15min') and time zone tz are passed on to
+# axis.period_axis. With output='arrays', x, y, dr and pr are numpy arrays (and lists of
+# array views) instead of lists, which is a lot faster for sub-daily resolutions.
+# With output='curve', only a curve.Curve holding the parameters is returned, and no
+# curve values are calculated. With output='pandas', a pandas.DataFrame with the period,
+# price and smfc of each date is returned (see frames.axis_frame).
+# The time spent in each stage can be recorded with profiling.profile().
+def build_smfc_curve(prices, start_date=None, flatten=True, corr_avg=False, method='banded',
+                     resolution='D', tz=None, output='lists'):
+    with profiling.build('build_smfc_curve'):
+        if start_date is None:
+            start_date = datetime.now()
+        if output not in ('lists', 'arrays', 'curve', 'pandas'):
+            raise ValueError('Unknown output "{}". Use "lists", "arrays", "curve" or "pandas"'.format(output))
+        if output == 'curve':
+            from curvy.curve import Curve
+            if method == 'banded':
+                plan = get_plan(start_date, len(prices), resolution, tz)
+                return Curve.from_period_axis(plan.solve(prices, exact_avg=corr_avg), plan.axis, resolution)
+            with profiling.stage('calendar', num_periods=len(prices)):
+                period, y = axis.get_axis(start_date, prices, resolution, tz)
+            X = calc_smfc_params(axis.axis_ranges(period), prices, method, exact_avg=corr_avg)
+            return Curve.from_period_axis(X, period, resolution)
+        if output == 'pandas':
+            from curvy import frames
+            if method == 'banded':
+                plan = get_plan(start_date, len(prices), resolution, tz)
+                period = plan.axis
+                X = plan.solve(prices, exact_avg=corr_avg)
+                y_smfc = batch_segment_values(plan.lengths, X.reshape(-1, 1), local=True)[0]
+            else:
+                with profiling.stage('calendar', num_periods=len(prices)):
+                    period, y = axis.get_axis(start_date, prices, resolution, tz)
+                y_smfc = calc_smfc(axis.axis_ranges(period), prices, True, method=method, exact_avg=corr_avg)
+            with profiling.stage('calendar', num_periods=len(prices)):
+                return frames.axis_frame(period, prices, tz, y_smfc)
+        if method == 'banded':
+            plan = get_plan(start_date, len(prices), resolution, tz)
+            x, y, dr, pr = plan.get_ranges(prices) if output == 'lists' else plan.get_arrays(prices)
+            y_smfc = plan.calc_smfc(prices, flatten, exact_avg=corr_avg)
+        else:
+            get = axis.get_ranges if output == 'lists' else axis.get_arrays
+            with profiling.stage('calendar', num_periods=len(prices)):
+                x, y, dr, pr = get(start_date, prices, resolution, tz)
+            y_smfc = calc_smfc(dr, prices, flatten, method=method, exact_avg=corr_avg)
+        return x, y, dr, pr, y_smfc
+
+# Builds one smooth curve per row in the prices matrix, all on the same dates. The KKT
+# system is factorized once (or taken from the plan cache) and solved for all rows at once.
+# Returns the dates, the date ranges and a matrix with one curve per row.
+# The curves can be written into a preallocated out array (e.g. a numpy.memmap) chunk_size
+# steps at a time, see batch_segment_values.
+# With output='pandas', a wide pandas.DataFrame with one column per curve is returned
+# instead, which wraps the curve values without a copy (see frames.curves_frame).
+def build_smfc_curves(prices, start_date=None, corr_avg=False, resolution='D', tz=None, output='lists',
+                      out=None, chunk_size=None):
     if start_date is None:
         start_date = datetime.now()
-    x, y, dr, pr = axis.get_ranges(start_date, prices)
-    y_smfc = calc_smfc(dr, prices, flatten)
-
-    if (corr_avg):
-        y_smfc_no_flat = calc_smfc(dr, prices, False)
-        diff = avg_diff(y_smfc_no_flat, prices)
-        corrected_prices = [f - d for f, d in zip(prices, diff)]
-        y_smfc = calc_smfc(dr, corrected_prices, flatten)
+    if output not in ('lists', 'arrays', 'pandas'):
+        raise ValueError('Unknown output "{}". Use "lists", "arrays" or "pandas"'.format(output))
+    prices = np.asarray(prices, dtype='float64')
+    if prices.ndim != 2:
+        raise ValueError('The prices need to be a matrix with one row per curve')
+    with profiling.build('build_smfc_curves'):
+        plan = get_plan(start_date, prices.shape[1], resolution, tz)
+        X = plan.solve(prices, exact_avg=corr_avg)
+        y_smfc = batch_segment_values(plan.lengths, X, local=True, out=out, chunk_size=chunk_size)
+        with profiling.stage('calendar', num_periods=prices.shape[1]):
+            if output == 'pandas':
+                from curvy import frames
+                return frames.curves_frame(plan.axis.dates, y_smfc, tz)
+            if output == 'arrays':
+                return plan.axis.dates, np.split(plan.axis.dates, plan.axis.starts[1:]), y_smfc
+            return plan.axis.dates.tolist(), plan.dr, y_smfc
 
-    return x, y, dr, pr, y_smfc
+# Builds the smooth curve, but yields the dates and curve values chunk_size steps at a
+# time instead of returning all of them. Only one chunk of curve values is held in memory.
+def iter_smfc_curve(prices, start_date=None, chunk_size=65536, corr_avg=False, resolution='D', tz=None):
+    if start_date is None:
+        start_date = datetime.now()
+    plan = get_plan(start_date, len(prices), resolution, tz)
+    X = plan.solve(prices, exact_avg=corr_avg)
+    for index, values in iter_segment_values(plan.lengths, X, chunk_size, local=True):
+        yield plan.axis.dates[index], values
 
 def avg_diff(y_smfc_no_flat, forward_prices):
     diff = []
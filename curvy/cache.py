@@ -0,0 +1,193 @@
+import collections
+import hashlib
+import os
+import numpy as np
+from datetime import datetime
+from curvy import axis, builder
+
+# Opt-in memoization of curve values, keyed by a hash of the inputs, the options and
+# CACHE_VERSION. Results are kept in an in-memory LRU tier and, with a directory, in an
+# on-disk tier of .npy files that are memory-mapped when read. The directory can be shared
+# by processes: its size is read from the directory before each write, and it is kept
+# below max_disk_bytes by removing the files that were least recently used (by mtime).
+# Ex:
+# curves = cache.CurveCache(directory='/tmp/curvy-cache')
+# x, y, dr, pr, y_smfc = curves.build_smfc_curve(prices, start_date)
+# curves.stats()
+
+# Version of the cached results. Bump it whenever a change to the builder changes the
+# curve values, so results cached on disk by older code are not used.
+CACHE_VERSION = 1
+
+# Returns the hex digest of a hash of the parts, CACHE_VERSION and the function name.
+# Arrays are hashed by their float64 bytes and shape, other parts by their repr.
+def input_key(name, *parts):
+    digest = hashlib.sha256()
+    digest.update(repr((CACHE_VERSION, name)).encode())
+    for part in parts:
+        if isinstance(part, np.ndarray):
+            digest.update(repr(part.shape).encode())
+            digest.update(np.ascontiguousarray(part, dtype='float64').tobytes())
+        else:
+            digest.update(repr(part).encode())
+    return digest.hexdigest()
+
+class CurveCache:
+    def __init__(self, max_entries=256, directory=None, max_disk_bytes=2**30):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_disk_bytes = max_disk_bytes
+        self._memory = collections.OrderedDict()
+        self._counts = collections.Counter()
+        # Size of each file in the disk tier, from least to most recently used.
+        self._disk = collections.OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._scan()
+
+    # Reads the files of the disk tier from the directory, which other processes may have
+    # added to or removed from.
+    def _scan(self):
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.npy'):
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        self._disk = collections.OrderedDict((key, size) for mtime, key, size in sorted(files))
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.npy')
+
+    # Returns the cached values for the key, or None. The values are read-only.
+    def get(self, key):
+        if key in self._memory:
+            self._memory.move_to_end(key)
+            self._counts['memory_hits'] += 1
+            return self._memory[key]
+        if key in self._disk:
+            try:
+                values = np.load(self._path(key), mmap_mode='r')
+            except (OSError, ValueError):
+                # Removed or corrupt, e.g. by another process sharing the directory.
+                del self._disk[key]
+            else:
+                os.utime(self._path(key))
+                self._disk.move_to_end(key)
+                self._counts['disk_hits'] += 1
+                self._remember(key, values)
+                return values
+        self._counts['misses'] += 1
+        return None
+
+    # Caches the values for the key in memory and, with a directory, on disk. Returns the
+    # values as a read-only array.
+    def put(self, key, values):
+        values = np.asarray(values)
+        values.flags.writeable = False
+        self._remember(key, values)
+        if self.directory is not None and key not in self._disk:
+            path = self._path(key)
+            temp = '{}.{}.tmp'.format(path, os.getpid())
+            with open(temp, 'wb') as f:
+                np.save(f, values)
+            os.replace(temp, path)
+            self._disk[key] = os.path.getsize(path)
+            self._evict_disk()
+        return values
+
+    def _remember(self, key, values):
+        self._memory[key] = values
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._counts['memory_evictions'] += 1
+
+    def _evict_disk(self):
+        self._scan()
+        total = sum(self._disk.values())
+        while total > self.max_disk_bytes and len(self._disk) > 1:
+            key, size = self._disk.popitem(last=False)
+            total -= size
+            self._counts['disk_evictions'] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    # Returns the hit, miss and eviction counts and the size of each tier.
+    def stats(self):
+        hits = self._counts['memory_hits'] + self._counts['disk_hits']
+        lookups = hits + self._counts['misses']
+        return {
+            'hits': hits,
+            'misses': self._counts['misses'],
+            'memory_hits': self._counts['memory_hits'],
+            'disk_hits': self._counts['disk_hits'],
+            'hit_rate': hits / lookups if lookups else 0.0,
+            'memory_evictions': self._counts['memory_evictions'],
+            'disk_evictions': self._counts['disk_evictions'],
+            'memory_entries': len(self._memory),
+            'disk_entries': len(self._disk),
+            'disk_bytes': sum(self._disk.values()),
+        }
+
+    # Empties both tiers and resets the counts.
+    def clear(self):
+        self._memory.clear()
+        self._counts.clear()
+        for key in list(self._disk):
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+        self._disk.clear()
+
+    # Same as builder.calc_smfc, with the curve values taken from the cache when the range
+    # lengths, prices and options are the same.
+    def calc_smfc(self, dr, prices, flatten=True, method='banded', exact_avg=False, local=True):
+        lengths = axis.range_lengths(dr)
+        key = input_key('calc_smfc', lengths.astype('float64'), np.asarray(prices, dtype='float64'),
+                        method, exact_avg, local)
+        values = self.get(key)
+        if values is None:
+            values = self.put(key, builder.calc_smfc(dr, prices, True, method, exact_avg, local))
+        return values if flatten else np.split(values, np.cumsum(lengths)[:-1])
+
+    # Same as builder.build_smfc_curve, with the curve values taken from the cache when the
+    # prices, the date of start_date and the options are the same. The dates and prices are
+    # not cached, as they come from the plan cache. output='curve' is not cached.
+    def build_smfc_curve(self, prices, start_date=None, flatten=True, corr_avg=False, method='banded',
+                         resolution='D', tz=None, output='lists'):
+        if start_date is None:
+            start_date = datetime.now()
+        if output == 'curve':
+            return builder.build_smfc_curve(prices, start_date, flatten, corr_avg, method, resolution, tz, output)
+        if output not in ('lists', 'arrays', 'pandas'):
+            raise ValueError('Unknown output "{}". Use "lists", "arrays", "curve" or "pandas"'.format(output))
+        key = input_key('build_smfc_curve', np.asarray(prices, dtype='float64'), axis.to_day(start_date),
+                        corr_avg, method, resolution, tz)
+        values = self.get(key)
+        if method == 'banded':
+            plan = builder.get_plan(start_date, len(prices), resolution, tz)
+            period = plan.axis
+            if values is None:
+                values = self.put(key, builder.batch_segment_values(
+                    plan.lengths, plan.solve(prices, corr_avg).reshape(-1, 1), local=True
+                )[0])
+        else:
+            period, y = axis.get_axis(start_date, prices, resolution, tz)
+            if values is None:
+                values = self.put(key, builder.calc_smfc(axis.axis_ranges(period), prices, True, method,
+                                                         exact_avg=corr_avg))
+        if output == 'pandas':
+            from curvy import frames
+            return frames.axis_frame(period, prices, tz, values)
+        if method == 'banded':
+            x, y, dr, pr = plan.get_ranges(prices) if output == 'lists' else plan.get_arrays(prices)
+        else:
+            get = axis.get_ranges if output == 'lists' else axis.get_arrays
+            x, y, dr, pr = get(start_date, prices, resolution, tz)
+        return x, y, dr, pr, values if flatten else np.split(values, period.starts[1:])
@@ -0,0 +1,235 @@
+import argparse
+import collections
+import itertools
+import os
+import sys
+import time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from curvy import axis, backfill, builder
+
+# The curvy console command: reads quotes from a CSV or Parquet file in chunks, builds one
+# curve per curve id and trade date in batches over a process pool and streams the curves
+# to a Parquet file or a directory of NumPy files.
+#
+# The quotes are in long format, one row per price, e.g.
+# curve_id,trade_date,period,price
+# NO1,2018-11-26,0,30.5
+# NO1,2018-11-26,1,31.2
+# ...
+# The rows must be sorted by curve id and trade date, so only the rows of the curve at the
+# end of each chunk are kept between chunks, and the memory use does not grow with the
+# number of curves.
+# The prices of a curve are ordered by the period column, or by row order without one.
+#
+# Ex:
+# curvy quotes.csv -o curves.parquet --workers 8
+
+# Yields the quotes of a CSV or Parquet file as pandas.DataFrame chunks of about chunk_rows rows.
+def read_chunks(path, chunk_rows=1000000, columns=None):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_rows, columns=columns):
+            yield batch.to_pandas()
+    else:
+        import pandas as pd
+        yield from pd.read_csv(path, chunksize=chunk_rows, usecols=columns)
+
+# Groups the rows of the chunks into curves and yields (curve_id, trade_date, prices), with
+# the trade date as datetime64[D]. The rows of the last curve in a chunk are kept until the
+# next chunk, as the curve may continue there. Raises a ValueError if the rows are not
+# sorted by curve id and trade date, which is checked against the previous curve only.
+def iter_curves(chunks, id_column='curve_id', date_column='trade_date', price_column='price', period_column=None):
+    import pandas as pd
+    previous = None
+    rest = None
+    for chunk in itertools.chain(chunks, [None]):
+        last = chunk is None
+        if last:
+            if rest is None:
+                break
+            chunk = rest
+        elif rest is not None:
+            chunk = pd.concat((rest, chunk), ignore_index=True)
+        if len(chunk) == 0:
+            continue
+        ids = chunk[id_column].to_numpy()
+        dates = pd.to_datetime(chunk[date_column]).to_numpy().astype('datetime64[D]')
+        # Start of each run of rows with the same curve id and trade date.
+        changes = np.flatnonzero((ids[1:] != ids[:-1]) | (dates[1:] != dates[:-1])) + 1
+        starts = np.concatenate(([0], changes))
+        stops = np.concatenate((changes, [len(chunk)]))
+        prices = chunk[price_column].to_numpy(dtype='float64')
+        periods = None if period_column is None else chunk[period_column].to_numpy()
+        # The last run may continue in the next chunk.
+        num_runs = len(starts) if last else len(starts) - 1
+        rest = None if last else chunk.iloc[starts[-1]:]
+        for start, stop in zip(starts[:num_runs], stops[:num_runs]):
+            key = (ids[start], dates[start])
+            if previous is not None and key <= previous:
+                raise ValueError('The rows are not sorted by curve id and trade date at curve {} {}'.format(*key))
+            previous = key
+            y = prices[start:stop]
+            if periods is not None:
+                y = y[np.argsort(periods[start:stop], kind='stable')]
+            yield ids[start], dates[start], y
+
+# Builds a batch of curves, as a list of (curve_id, trade_date, prices). Curves with the
+# same period lengths share one factorization and are solved and evaluated together (see
+# backfill.solve_dates). Returns the curve ids, trade dates and dates of all curve values,
+# and the curve values, as flat arrays in long format. Runs in the worker processes.
+def build_batch(curves, corr_avg=False, resolution='D', tz=None):
+    firsts, signatures, params, _ = backfill.solve_dates(
+        np.array([c[1] for c in curves]), [c[2] for c in curves], corr_avg, resolution, tz
+    )
+    groups = collections.defaultdict(list)
+    for i, lengths in enumerate(signatures):
+        groups[lengths].append(i)
+    step = axis.resolution_step(resolution)
+    ids, trade_dates, dates, values = [], [], [], []
+    for lengths, positions in groups.items():
+        X = np.stack([params[i] for i in positions], axis=1)
+        y_smfc = builder.batch_segment_values(np.array(lengths), X, local=True)
+        num_steps = y_smfc.shape[1]
+        ids.append(np.repeat(np.array([curves[i][0] for i in positions], dtype=object), num_steps))
+        trade_dates.append(np.repeat(np.array([curves[i][1] for i in positions]), num_steps))
+        starts = np.array([firsts[i] for i in positions])
+        dates.append((starts[:, None] + np.arange(num_steps) * step).ravel())
+        values.append(y_smfc.ravel())
+    return np.concatenate(ids), np.concatenate(trade_dates), np.concatenate(dates), np.concatenate(values)
+
+# Writes the batches of curve values to a Parquet file, one row group per batch.
+class ParquetSink:
+    def __init__(self, path):
+        self.path = path
+        self._writer = None
+
+    def write(self, ids, trade_dates, dates, values):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        table = pa.table({
+            'curve_id': pa.array(ids.tolist()),
+            'trade_date': trade_dates,
+            'date': dates.astype('datetime64[s]'),
+            'value': values,
+        })
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+# Writes each batch of curve values to a NumPy .npz file in a directory.
+class NumpySink:
+    def __init__(self, path):
+        self.path = path
+        self._part = 0
+        os.makedirs(path, exist_ok=True)
+
+    def write(self, ids, trade_dates, dates, values):
+        np.savez(os.path.join(self.path, 'part-{:05d}.npz'.format(self._part)),
+                 curve_id=ids.astype(str), trade_date=trade_dates, date=dates, value=values)
+        self._part += 1
+
+    def close(self):
+        pass
+
+# Runs the functions in the calling process, for workers=1.
+class _InlineExecutor:
+    def submit(self, func, *args):
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+# Reads the quotes, builds the curves and writes them to the output. At most 2 * workers
+# batches are built or waiting to be written at a time, which bounds the memory use.
+# Returns the number of quote rows, curves and curve values and the elapsed time.
+def run(input_path, output_path, output_format=None, chunk_rows=1000000, batch_size=1024, workers=None,
+        corr_avg=False, resolution='D', tz=None, id_column='curve_id', date_column='trade_date',
+        price_column='price', period_column=None):
+    start = time.perf_counter()
+    if output_format is None:
+        output_format = 'parquet' if output_path.endswith('.parquet') else 'numpy'
+    if output_format not in ('parquet', 'numpy'):
+        raise ValueError('Unknown output format "{}". Use "parquet" or "numpy"'.format(output_format))
+    workers = workers or os.cpu_count() or 1
+    stats = collections.Counter()
+    columns = [id_column, date_column, price_column] + ([period_column] if period_column else [])
+
+    def counted(chunks):
+        for chunk in chunks:
+            stats['rows'] += len(chunk)
+            yield chunk
+
+    sink = ParquetSink(output_path) if output_format == 'parquet' else NumpySink(output_path)
+    executor = _InlineExecutor() if workers == 1 else ProcessPoolExecutor(max_workers=workers)
+    try:
+        with executor:
+            pending = collections.deque()
+
+            def write_oldest():
+                ids, trade_dates, dates, values = pending.popleft().result()
+                sink.write(ids, trade_dates, dates, values)
+                stats['values'] += len(values)
+
+            batch = []
+            curves = iter_curves(counted(read_chunks(input_path, chunk_rows, columns)), id_column, date_column,
+                                 price_column, period_column)
+            for curve in curves:
+                batch.append(curve)
+                if len(batch) == batch_size:
+                    pending.append(executor.submit(build_batch, batch, corr_avg, resolution, tz))
+                    stats['curves'] += len(batch)
+                    batch = []
+                    while len(pending) >= 2 * workers:
+                        write_oldest()
+            if batch:
+                pending.append(executor.submit(build_batch, batch, corr_avg, resolution, tz))
+                stats['curves'] += len(batch)
+            while pending:
+                write_oldest()
+    finally:
+        sink.close()
+    stats['seconds'] = time.perf_counter() - start
+    return dict(stats)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog='curvy', description='Build smooth forward curves from a file of quotes.')
+    parser.add_argument('input', help='CSV or Parquet file with one row per quote')
+    parser.add_argument('-o', '--output', required=True,
+                        help='Parquet file, or directory for NumPy files (see --format)')
+    parser.add_argument('--format', choices=['parquet', 'numpy'],
+                        help='Output format, by default parquet for a .parquet output and numpy otherwise')
+    parser.add_argument('--chunk-rows', type=int, default=1000000, help='Quote rows read at a time')
+    parser.add_argument('--batch-size', type=int, default=1024, help='Curves built per task')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes, by default one per core')
+    parser.add_argument('--corr-avg', action='store_true', help='Make the mean of each period exactly its price')
+    parser.add_argument('--resolution', default='D', help='D, h, 30min or 15min')
+    parser.add_argument('--tz', default=None, help='Time zone for sub-daily resolutions, e.g. Europe/Oslo')
+    parser.add_argument('--id-column', default='curve_id')
+    parser.add_argument('--date-column', default='trade_date')
+    parser.add_argument('--price-column', default='price')
+    parser.add_argument('--period-column', default=None, help='Column with the period number of each price')
+    args = parser.parse_args(argv)
+    stats = run(
+        args.input, args.output, args.format, args.chunk_rows, args.batch_size, args.workers, args.corr_avg,
+        args.resolution, args.tz, args.id_column, args.date_column, args.price_column, args.period_column,
+    )
+    seconds = max(stats.get('seconds', 0), 1e-9)
+    print('{} rows, {} curves, {} values in {:.2f} s ({:.0f} rows/s, {:.0f} curves/s)'.format(
+        stats.get('rows', 0), stats.get('curves', 0), stats.get('values', 0), seconds,
+        stats.get('rows', 0) / seconds, stats.get('curves', 0) / seconds,
+    ), file=sys.stderr)
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
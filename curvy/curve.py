@@ -0,0 +1,121 @@
+import numpy as np
+from curvy import axis, builder
+from datetime import datetime
+
+# A smooth curve stored as the parameters of each segment and the breakpoints between the
+# segments, in the same index units (days, hours, ...) as the builder. The parameters are
+# in segment-local coordinates (see builder.segment_frames), so segment i is a polynomial
+# in s = (u - breakpoints[i]) / (breakpoints[i + 1] - breakpoints[i]). The curve can be
+# evaluated and integrated anywhere, without calculating all the curve values.
+# With an origin (the datetime64 of index 0) and a step (timedelta64 of one index), the
+# curve can also be called with datetime64 values.
+class Curve:
+    def __init__(self, params, breakpoints, origin=None, step=None):
+        self.params = np.reshape(np.asarray(params, dtype='float64'), (-1, 5))
+        self.breakpoints = np.asarray(breakpoints, dtype='float64')
+        if len(self.breakpoints) != len(self.params) + 1:
+            raise ValueError('There must be one more breakpoint than segments')
+        self.widths = np.diff(self.breakpoints)
+        self.origin = origin
+        self.step = step
+
+    # Creates the curve from the parameters of a curve built on a PeriodAxis.
+    @classmethod
+    def from_period_axis(cls, params, period_axis, resolution='D'):
+        breakpoints = np.append(period_axis.starts, period_axis.starts[-1] + period_axis.lengths[-1])
+        return cls(np.concatenate(params) if isinstance(params, list) else params,
+                   breakpoints, period_axis.dates[0], axis.resolution_step(resolution))
+
+    # Converts datetime64 values into (fractional) indices. Other values are taken as indices.
+    def to_index(self, t):
+        t = np.asarray(t)
+        if np.issubdtype(t.dtype, np.datetime64) or t.dtype == object:
+            if self.origin is None:
+                raise ValueError('The curve needs an origin and a step to be called with dates')
+            return (t.astype(self.origin.dtype) - self.origin) / self.step
+        return t.astype('float64')
+
+    # Returns the segment index and local coordinate of each index.
+    def _locate(self, u):
+        i = np.clip(np.searchsorted(self.breakpoints, u, side='right') - 1, 0, len(self.params) - 1)
+        return i, (u - self.breakpoints[i]) / self.widths[i]
+
+    # Evaluates the curve at the given indices or dates with Horner's method. Values
+    # outside the curve are nan.
+    def __call__(self, t):
+        u = self.to_index(t)
+        i, s = self._locate(u)
+        c = self.params[i]
+        values = (((c[..., 0] * s + c[..., 1]) * s + c[..., 2]) * s + c[..., 3]) * s + c[..., 4]
+        return np.where((u >= self.breakpoints[0]) & (u <= self.breakpoints[-1]), values, np.nan)
+
+    # Returns the integral of the curve from the start of the curve to each index.
+    def _antiderivative(self, u):
+        u = np.clip(u, self.breakpoints[0], self.breakpoints[-1])
+        integrals = self.widths * (self.params / np.arange(5, 0, -1)).sum(axis=1)
+        cumulative = np.concatenate(([0], np.cumsum(integrals)))
+        i, s = self._locate(u)
+        c = self.params[i] / np.arange(5, 0, -1)
+        partial = ((((c[..., 0] * s + c[..., 1]) * s + c[..., 2]) * s + c[..., 3]) * s + c[..., 4]) * s
+        return cumulative[i] + self.widths[i] * partial
+
+    # Returns the integral of the curve between a and b (indices or dates), in index units.
+    # The curve is taken as 0 outside its breakpoints.
+    def integrate(self, a, b):
+        return self._antiderivative(self.to_index(b)) - self._antiderivative(self.to_index(a))
+
+    # Returns the curve values at every index, as from builder.build_smfc_curve.
+    def values(self):
+        lengths = self.widths.astype('int64')
+        return builder.batch_segment_values(lengths, self.params.reshape(-1, 1), local=True)[0]
+
+    # Converts the curve into a scipy.interpolate.PPoly over the indices.
+    def to_ppoly(self):
+        from scipy.interpolate import PPoly
+        coefs = self.params / self.widths[:, None] ** np.arange(4, -1, -1)
+        return PPoly(coefs.T, self.breakpoints)
+
+# A smooth curve that can be kept up to date as single forward prices change. The curve
+# is a linear function of the prices, so when one price changes, the parameters and curve
+# values are corrected by the change times the curve for a price of 1 in that period
+# (see CurvePlan.unit_solution). No matrices are built and nothing is factorized again.
+# The unit solutions are kept by the LiveCurve, so each is solved once per period.
+class LiveCurve:
+    def __init__(self, prices, start_date=None, corr_avg=False, resolution='D', tz=None):
+        if start_date is None:
+            start_date = datetime.now()
+        self.plan = builder.get_plan(start_date, len(prices), resolution, tz)
+        self.corr_avg = corr_avg
+        self.prices = np.array(prices, dtype='float64')
+        self.X = self.plan.solve(self.prices, exact_avg=corr_avg)
+        self.y_smfc = self._values(self.X)
+        self._unit_solutions = {}
+
+    def _values(self, X):
+        return builder.batch_segment_values(self.plan.lengths, X[:, None], local=True)[0]
+
+    # The dates of the curve.
+    @property
+    def x(self):
+        return self.plan.axis.dates
+
+    # The parameters of each segment, in segment-local coordinates.
+    @property
+    def params(self):
+        return builder.split_params(self.X)
+
+    # Returns a Curve with the current parameters.
+    def to_curve(self):
+        return Curve.from_period_axis(self.X.copy(), self.plan.axis, self.plan.resolution)
+
+    # Changes the price of one period and updates the parameters and curve values.
+    def update_price(self, period_index, new_price):
+        delta = new_price - self.prices[period_index]
+        if delta == 0:
+            return
+        if period_index not in self._unit_solutions:
+            self._unit_solutions[period_index] = self.plan.unit_solution(period_index, self.corr_avg)
+        unit_X = self._unit_solutions[period_index]
+        self.X += delta * unit_X
+        self.y_smfc += delta * self._values(unit_X)
+        self.prices[period_index] = new_price
@@ -0,0 +1,90 @@
+import numpy as np
+from curvy import axis, builder
+
+# Checks of a curve computed in closed form from its parameters (as from solve_lineq,
+# KKTFactorization.solve or CurvePlan.solve), without evaluating the curve values. X holds
+# the a, b, c, d and e parameters of each segment in one column, or one column per curve
+# for a batch of curves. With local=True (the default of the builder) the parameters are
+# in segment-local coordinates (see builder.segment_frames). Derivatives are per step.
+# Ex:
+# plan = builder.get_plan(start_date, len(prices))
+# diagnostics.diagnose(plan.lengths, plan.solve(prices), prices)
+
+# Returns the parameters as an array of shape (num_segments, 5, num_curves).
+def _segment_params(lengths, X):
+    X = np.asarray(X, dtype='float64')
+    if X.shape[0] != 5 * len(lengths):
+        raise ValueError('Arrays do not match in length')
+    return X.reshape(len(lengths), 5, -1)
+
+# Returns the weights that give the mean of the curve values in each segment from the
+# parameters, one row per segment.
+def mean_weights(lengths, local=True):
+    lengths = np.asarray(lengths, dtype='float64')
+    if local:
+        return builder.local_mean_weights(lengths)
+    taus = axis.start_end_index_array(lengths, overlap=1)
+    return builder.power_sums(taus)[:, ::-1] / lengths[:, None]
+
+# Returns the mean of the curve values in each period, the same as the mean of each range
+# from curve_values. With a batch of curves the result has one row per curve.
+def period_means(lengths, X, local=True):
+    means = np.einsum('nk,nkm->mn', mean_weights(lengths, local), _segment_params(lengths, X))
+    return means[0] if np.ndim(X) == 1 else means
+
+# Returns the mean of the curve values in each period minus the price, the same as
+# builder.avg_diff. The prices have one row per curve for a batch of curves.
+def average_errors(lengths, X, prices, local=True):
+    return period_means(lengths, X, local) - np.asarray(prices, dtype='float64')
+
+# Returns the rows that give the value, 1st and 2nd derivative of the segments before
+# (left) and after (right) each knot from their parameters, shape (num_segments - 1, 3, 5).
+def _knot_rows(lengths, local=True):
+    lengths = np.asarray(lengths, dtype='float64')
+    if not local:
+        knots = axis.knot_index_array(axis.start_end_index_array(lengths, overlap=1))
+        rows = builder.calc_knot_constraints(knots)
+        return rows, rows
+    # The knot is at s = 1 of the segment before and s = 0 of the segment after. The
+    # derivatives in s are divided by the segment length to get them per step.
+    ones = np.ones(len(lengths) - 1)
+    left = builder.calc_knot_constraints(ones) * builder.power_table(1 / lengths[:-1], 2)[:, :, None]
+    right = builder.calc_knot_constraints(0 * ones) * builder.power_table(1 / lengths[1:], 2)[:, :, None]
+    return left, right
+
+# Returns the jump in the value, 1st and 2nd derivative of the curve at each knot, shape
+# (num_segments - 1, 3), or (num_curves, num_segments - 1, 3) for a batch of curves. The
+# curve is smooth where they are all zero.
+def knot_jumps(lengths, X, local=True):
+    if len(lengths) < 2:
+        raise ValueError('There must be at least 2 ranges in the list')
+    params = _segment_params(lengths, X)
+    left, right = _knot_rows(lengths, local)
+    jumps = np.einsum('njk,nkm->mnj', right, params[1:]) - np.einsum('njk,nkm->mnj', left, params[:-1])
+    return jumps[0] if np.ndim(X) == 1 else jumps
+
+# Returns the objective of the curve, the integral of the squared 2nd derivative over all
+# segments, from the H blocks. Returns one value per curve for a batch of curves.
+def objective(lengths, X, local=True):
+    taus = axis.start_end_index_array(lengths, overlap=1)
+    if local:
+        # Without the scaling of calc_local_H_blocks, so the value is the same in both coordinates.
+        H = builder.calc_local_H_blocks(taus) / builder.segment_frames(taus)[1].min()**3
+    else:
+        H = builder.calc_H_blocks(taus)
+    params = _segment_params(lengths, X)
+    values = np.einsum('nkm,nkl,nlm->m', params, H, params)
+    return values[0] if np.ndim(X) == 1 else values
+
+# Returns all the checks of the curve (or batch of curves) as a dict: the period means,
+# the largest absolute average error, the largest absolute jump at the knots for the
+# value, 1st and 2nd derivative, and the objective. The errors are left out without prices.
+def diagnose(lengths, X, prices=None, local=True):
+    means = period_means(lengths, X, local)
+    result = {'means': means}
+    if prices is not None:
+        result['max_error'] = np.abs(means - np.asarray(prices, dtype='float64')).max(axis=-1)
+    if len(lengths) > 1:
+        result['max_jump'] = np.abs(knot_jumps(lengths, X, local)).max(axis=-2)
+    result['objective'] = objective(lengths, X, local)
+    return result
@@ -0,0 +1,35 @@
+import numpy as np
+import pandas as pd
+from curvy import axis
+
+# pandas output for the builder. The curve values and price arrays are wrapped by the
+# frames without copies. pandas has no daily or minute datetime resolution, so the dates
+# are cast once to datetime64[s], which is vectorized, and the index wraps that array.
+
+# Returns a DatetimeIndex over the datetime64 dates. With a time zone tz, sub-daily dates
+# are taken as UTC (as from axis.bounds_axis) and the index is converted to tz. Daily dates
+# are left without a time zone.
+def date_index(dates, tz=None):
+    index = pd.DatetimeIndex(dates.astype('datetime64[s]', copy=False), copy=False, name='date')
+    if tz is not None and np.datetime_data(dates.dtype)[0] != 'D':
+        index = index.tz_localize('UTC').tz_convert(tz)
+    return index
+
+# Returns a frame with the period number and the price of every date on the PeriodAxis.
+# Same as axis.get_ranges, but as one frame instead of lists. The curve values y_smfc
+# are added as the column 'smfc' if given.
+def axis_frame(period_axis, prices, tz=None, y_smfc=None):
+    if len(period_axis.lengths) != len(prices):
+        raise ValueError('The number of date ranges and forwards prices need to be the same')
+    columns = {
+        'period': np.repeat(np.arange(len(prices)), period_axis.lengths),
+        'price': axis.price_array(period_axis.lengths, np.asarray(prices, dtype='float64')),
+    }
+    if y_smfc is not None:
+        columns['smfc'] = y_smfc
+    return pd.DataFrame(columns, index=date_index(period_axis.dates, tz), copy=False)
+
+# Returns a wide frame with one column of curve values per row in y_smfc, e.g. from
+# builder.build_smfc_curves. The frame wraps the transpose of y_smfc without a copy.
+def curves_frame(dates, y_smfc, tz=None, columns=None):
+    return pd.DataFrame(y_smfc.T, index=date_index(dates, tz), columns=columns, copy=False)
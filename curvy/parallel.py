@@ -0,0 +1,82 @@
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from multiprocessing import shared_memory
+from curvy import axis, builder
+
+# Returns the key of the curve plan for a start date (see builder.get_plan). Curves with
+# the same key share the date structure and the factorized system.
+def plan_key(start_date, num_periods, resolution='D', tz=None):
+    return (axis.to_day(start_date).tolist(), num_periods, resolution, tz)
+
+# Groups the curve ids of the inputs ({curve_id: (prices, start_date)}) by plan key.
+def group_inputs(inputs, resolution='D', tz=None):
+    groups = {}
+    for curve_id, (prices, start_date) in inputs.items():
+        key = plan_key(start_date, len(prices), resolution, tz)
+        groups.setdefault(key, []).append(curve_id)
+    return groups
+
+# Builds the curves for one chunk of prices with the same plan and writes them into rows
+# of the (num_curves, num_dates) matrix in the shared memory block. Runs in the worker
+# processes, where the plan cache keeps the factorization between chunks.
+def _build_chunk(shm_name, shape, row, prices, start_date, corr_avg, resolution, tz):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        out = np.ndarray(shape, dtype='float64', buffer=shm.buf)
+        plan = builder.get_plan(start_date, prices.shape[1], resolution, tz)
+        X = plan.solve(prices, exact_avg=corr_avg)
+        out[row:row + len(prices)] = builder.batch_segment_values(plan.lengths, X, local=True)
+        del out
+    finally:
+        shm.close()
+
+# Closes and removes a shared memory block made by build_smfc_curves_parallel.
+def _free(shm):
+    shm.close()
+    shm.unlink()
+
+# Builds many curves in parallel over a process pool. The inputs are a mapping of
+# {curve_id: (prices, start_date)}. Curves that share a date structure are built together,
+# chunksize curves at a time, so each chunk is one multi price solve on one factorization.
+# The workers write the curves straight into one shared memory block per date structure,
+# so no curve values are pickled. Returns {curve_id: (x, y_smfc)} with the dates and curve
+# values as arrays. The curve values are copied out of shared memory, one block at a time,
+# and each block is freed right after its copy, so the peak memory is the curve values
+# plus the largest block.
+def build_smfc_curves_parallel(inputs, max_workers=None, chunksize=256, corr_avg=False, resolution='D', tz=None):
+    if chunksize < 1:
+        raise ValueError('The chunksize must be at least 1')
+    blocks = []
+    curves = {}
+    try:
+        for (day, num_periods, _, _), curve_ids in group_inputs(inputs, resolution, tz).items():
+            # Only the dates are needed here, the plans are factorized in the workers.
+            start_date = datetime(day.year, day.month, day.day)
+            num_eoms = axis.strip_eoms(start_date, num_periods)
+            dates = axis.period_axis(start_date, num_eoms, resolution=resolution, tz=tz).dates
+            dates.flags.writeable = False
+            shape = (len(curve_ids), len(dates))
+            shm = shared_memory.SharedMemory(create=True, size=max(8 * shape[0] * shape[1], 1))
+            blocks.append((shm, start_date, curve_ids, dates, shape, []))
+
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            for shm, start_date, curve_ids, dates, shape, futures in blocks:
+                prices = np.array([inputs[curve_id][0] for curve_id in curve_ids], dtype='float64')
+                for row in range(0, len(curve_ids), chunksize):
+                    futures.append(executor.submit(
+                        _build_chunk, shm.name, shape, row, prices[row:row + chunksize], start_date, corr_avg,
+                        resolution, tz
+                    ))
+            while blocks:
+                shm, start_date, curve_ids, dates, shape, futures = blocks[0]
+                for future in futures:
+                    future.result()
+                y_smfc = np.ndarray(shape, dtype='float64', buffer=shm.buf).copy()
+                _free(blocks.pop(0)[0])
+                for i, curve_id in enumerate(curve_ids):
+                    curves[curve_id] = (dates, y_smfc[i])
+    finally:
+        for block in blocks:
+            _free(block[0])
+    return curves
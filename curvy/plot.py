@@ -1,6 +1,88 @@
-import matplotlib.pyplot as plt
+import numpy as np
+
+# matplotlib is imported by each function, so it is only loaded when something is plotted.
+#
+# Long curves are decimated before they are drawn, to about two points per pixel of the
+# axes width. decimate='minmax' keeps the lowest and highest point in each bin, so peaks
+# are kept, and decimate='lttb' picks the points with the Largest-Triangle-Three-Buckets
+# method. decimate=None draws every point.
+DECIMATE_METHODS = ('minmax', 'lttb')
+
+# Converts dates (lists of datetime.date or datetime.datetime, or datetime64 arrays) into
+# an array that can be decimated and drawn.
+def _to_array(values):
+    values = np.asarray(values)
+    if values.dtype == object:
+        values = values.astype('datetime64[us]')
+    return values
+
+# Returns the indices of the lowest and highest value in each of num_bins bins, and of
+# the first and last value.
+def minmax_indices(y, num_bins):
+    y = np.asarray(y, dtype='float64')
+    width = -(-len(y) // num_bins)
+    num_rows = -(-len(y) // width)
+    padded = np.full(num_rows * width, np.nan)
+    padded[:len(y)] = y
+    bins = padded.reshape(num_rows, width)
+    offsets = np.arange(num_rows) * width
+    # Bins with only nan would raise in nanargmin, so nan is replaced by inf / -inf.
+    low = np.argmin(np.where(np.isnan(bins), np.inf, bins), axis=1) + offsets
+    high = np.argmax(np.where(np.isnan(bins), -np.inf, bins), axis=1) + offsets
+    indices = np.concatenate(([0], low, high, [len(y) - 1]))
+    return np.unique(np.clip(indices, 0, len(y) - 1))
+
+# Returns the indices of num_points points picked by the Largest-Triangle-Three-Buckets
+# method. The first and last points are always kept, and for each bucket in between the
+# point that makes the largest triangle with the previous pick and the mean of the next
+# bucket is picked.
+def lttb_indices(x, y, num_points):
+    x = np.asarray(x, dtype='float64')
+    y = np.asarray(y, dtype='float64')
+    if num_points >= len(y) or num_points < 3:
+        return np.arange(len(y))
+    edges = np.linspace(1, len(y) - 1, num_points - 1).astype('int64')
+    indices = np.empty(num_points, dtype='int64')
+    indices[0] = 0
+    indices[-1] = len(y) - 1
+    for i in range(num_points - 2):
+        start, stop = edges[i], edges[i + 1]
+        next_stop = edges[i + 2] if i + 2 < len(edges) else len(y)
+        mean_x = x[stop:next_stop].mean()
+        mean_y = y[stop:next_stop].mean()
+        a = indices[i]
+        area = np.abs((x[a] - mean_x) * (y[start:stop] - y[a]) - (x[a] - x[start:stop]) * (mean_y - y[a]))
+        indices[i + 1] = start + np.argmax(area)
+    return indices
+
+# Returns x and y decimated to about num_points points with the method (see
+# DECIMATE_METHODS). Returns them as they are if they have fewer points than that.
+def decimate_points(x, y, num_points, method='minmax'):
+    x = _to_array(x)
+    y = np.asarray(y)
+    if method is None or len(y) <= num_points:
+        return x, y
+    if method == 'minmax':
+        indices = minmax_indices(y, max(num_points // 2, 1))
+    elif method == 'lttb':
+        u = x.astype('int64') if np.issubdtype(x.dtype, np.datetime64) else x
+        indices = lttb_indices(u, y, num_points)
+    else:
+        raise ValueError('Unknown decimate method "{}". Use one of {}'.format(method, DECIMATE_METHODS))
+    return x[indices], y[indices]
+
+# Returns the number of points to draw for the axes: two per pixel of its width.
+def _num_points(ax):
+    return max(2 * int(ax.get_window_extent().width), 4)
+
+# Shows the figure, unless show is False or the backend can not show figures (e.g. Agg).
+def _show(fig, show):
+    import matplotlib.pyplot as plt
+    if show and type(fig.canvas).required_interactive_framework is not None:
+        plt.show()
 
 def mpl_create_curve_plot(x):
+    import matplotlib.pyplot as plt
     plt.ioff()
     fig, ax = plt.subplots(figsize=(15,10))
     ax.set_title('Price curve')
@@ -10,17 +92,35 @@ def mpl_create_curve_plot(x):
     ax.grid(True)
     return fig, ax
 
-def mpl_plot_curves(dates, prices, fig, ax, *args):
-    ax.plot(dates, prices, color='blue')
+def mpl_plot_curves(dates, prices, fig, ax, *args, decimate='minmax', show=True):
+    num_points = _num_points(ax)
+    ax.plot(*decimate_points(dates, prices, num_points, decimate), color='blue')
     for arg in args:
         date_range, y, color, linestyle = arg
-        ax.plot(date_range, y, color=color, linestyle=linestyle)
-    plt.show()
+        ax.plot(*decimate_points(date_range, y, num_points, decimate), color=color, linestyle=linestyle)
+    _show(fig, show)
 
-def mpl_plot_curve_sections(dates, prices, fig, ax, *args, hide_price=False):
+# The sections of each arg are drawn as one LineCollection. The sections take the colors of
+# the default color cycle in turn, continuing from one arg to the next.
+def mpl_plot_curve_sections(dates, prices, fig, ax, *args, hide_price=False, decimate='minmax', show=True):
+    import matplotlib.dates as mdates
+    from matplotlib.collections import LineCollection
+    num_points = _num_points(ax)
     if not hide_price:
-        ax.plot(dates, prices, color='blue')
+        ax.plot(*decimate_points(dates, prices, num_points, decimate), color='blue')
+    num_sections = 0
     for arg in args:
-        for i in range(0, len(arg[0])):
-            ax.plot(arg[0][i], arg[1][i])
-    plt.show()
\ No newline at end of file
+        total = sum(len(y) for y in arg[1])
+        lines = []
+        for x, y in zip(arg[0], arg[1]):
+            # Each section gets its share of the points.
+            x, y = decimate_points(x, y, max(num_points * len(y) // total, 4), decimate)
+            if np.issubdtype(x.dtype, np.datetime64):
+                x = mdates.date2num(x)
+                ax.xaxis_date()
+            lines.append(np.column_stack((x, y)))
+        colors = ['C{}'.format(i % 10) for i in range(num_sections, num_sections + len(lines))]
+        num_sections += len(lines)
+        ax.add_collection(LineCollection(lines, colors=colors))
+    ax.autoscale_view()
+    _show(fig, show)
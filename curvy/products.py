@@ -0,0 +1,159 @@
+import functools
+import re
+import numpy as np
+from datetime import datetime
+from curvy import axis, builder, profiling
+
+# Product codes, relative to the Day Ahead (the day after the start date):
+# DA      the Day Ahead
+# BOM     the Balance of Month, from the day after DA to the end of the month
+# WE+n    the weekend (Saturday and Sunday) n weeks after the first one on or after DA.
+#         WE is the same as WE+0
+# W+n     the week (Monday to Sunday) n weeks after the week of DA
+# M+n     the month n months after the month of DA, M+0 is the month of DA
+# Q+n     the quarter n quarters after the quarter of DA
+# S+n     the season n seasons after the season of DA. Summer is April to September and
+#         winter October to March
+# Y+n     the year n years after the year of DA
+PRODUCT_PATTERN = re.compile(r'^(DA|BOM|WE|W|M|Q|S|Y)(?:\+(\d+))?$')
+PRODUCT_KINDS = ['DA', 'BOM', 'WE', 'W', 'M', 'Q', 'S', 'Y']
+
+# Number of months in, and the first month (0 is January) of one of the month based products.
+MONTH_SPANS = {'M': (1, 0), 'Q': (3, 0), 'S': (6, 3), 'Y': (12, 0)}
+
+# Maximum number of product plans kept by product_plan.
+PRODUCT_PLAN_CACHE_SIZE = 64
+
+# Returns the kind (index in PRODUCT_KINDS) and offset of each product code.
+# Ex: ['DA', 'M+1', 'Q+2'] -> [0, 4, 5], [0, 1, 2]
+def parse_products(codes):
+    kinds = np.empty(len(codes), dtype='int64')
+    offsets = np.zeros(len(codes), dtype='int64')
+    for i, code in enumerate(codes):
+        match = PRODUCT_PATTERN.match(code)
+        if match is None:
+            raise ValueError('Unknown product "{}"'.format(code))
+        kind, offset = match.groups()
+        if kind in ('DA', 'BOM') and offset is not None:
+            raise ValueError('The product "{}" does not take an offset'.format(kind))
+        if kind in ('W', 'M', 'Q', 'S', 'Y') and offset is None:
+            raise ValueError('The product "{}" needs an offset, e.g. "{}+1"'.format(kind, kind))
+        kinds[i] = PRODUCT_KINDS.index(kind)
+        offsets[i] = int(offset or 0)
+    return kinds, offsets
+
+# Returns the day of the week of days since 1970-01-01 (a Thursday), with Monday as 0.
+def _weekday(days):
+    return (days + 3) % 7
+
+# Returns the first day and the day after the last day of each product as datetime64 arrays.
+# All products of the same kind are resolved at once.
+def product_bounds(start_date, codes):
+    kinds, offsets = parse_products(codes)
+    da = axis.to_day(start_date) + 1
+    day = da.astype('int64')
+    month = da.astype('datetime64[M]').astype('int64')
+    begins = np.empty(len(kinds), dtype='int64')
+    ends = np.empty(len(kinds), dtype='int64')
+    for k, kind in enumerate(PRODUCT_KINDS):
+        mask = kinds == k
+        if not mask.any():
+            continue
+        n = offsets[mask]
+        if kind in MONTH_SPANS:
+            span, anchor = MONTH_SPANS[kind]
+            first = (month - anchor) // span * span + anchor + span * n
+            begins[mask] = first.astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+            ends[mask] = (first + span).astype('datetime64[M]').astype('datetime64[D]').astype('int64')
+        elif kind == 'DA':
+            begins[mask], ends[mask] = day, day + 1
+        elif kind == 'BOM':
+            month_end = (da.astype('datetime64[M]') + 1).astype('datetime64[D]').astype('int64')
+            if month_end == day + 1:
+                raise ValueError('There are no days left in the BOM')
+            begins[mask], ends[mask] = day + 1, month_end
+        elif kind == 'WE':
+            saturday = day + (5 - _weekday(day)) % 7 + 7 * n
+            begins[mask], ends[mask] = saturday, saturday + 2
+        else:
+            monday = day - _weekday(day) + 7 * n
+            begins[mask], ends[mask] = monday, monday + 7
+    return begins.astype('datetime64[D]'), ends.astype('datetime64[D]')
+
+# Splits the products into non-overlapping segments. Returns the first day of each segment
+# followed by the day after the last one, and a boolean matrix with one row per product
+# that tells which segments the product covers.
+# Ex: Q+1 and M+4 (the first month of Q+1) -> segments M+4 and the rest of Q+1
+def product_segments(begins, ends):
+    bounds = np.unique(np.concatenate((begins, ends)))
+    first = np.searchsorted(bounds, begins)
+    last = np.searchsorted(bounds, ends)
+    segments = np.arange(len(bounds) - 1)
+    cover = (segments >= first[:, None]) & (segments < last[:, None])
+    gaps = ~cover.any(axis=0)
+    if gaps.any():
+        raise ValueError('No product covers the days from {}'.format(bounds[:-1][gaps][0]))
+    return bounds, cover
+
+# Returns the price of each segment, so that the mean over the steps of each product is its
+# price. lengths is the number of steps in each segment. Raises a ValueError if the prices
+# do not determine the price of each segment, or if they are inconsistent (e.g. a quarter
+# is not the mean of its months) by more than tol.
+def segment_prices(cover, lengths, prices, tol=1e-6):
+    prices = np.asarray(prices, dtype='float64')
+    if len(prices) != len(cover):
+        raise ValueError('The number of products and prices need to be the same')
+    weights = cover * lengths
+    totals = prices * weights.sum(axis=1)
+    x, residuals, rank, sv = np.linalg.lstsq(weights, totals, rcond=None)
+    if rank < len(lengths):
+        raise ValueError('The products do not determine the price of each segment')
+    error = np.abs(weights @ x - totals) / weights.sum(axis=1)
+    if error.max() > tol * max(1, np.abs(prices).max()):
+        raise ValueError('The product prices are inconsistent')
+    return x
+
+# Returns the segments of the products as a PeriodAxis and the matrix of which segments each
+# product covers (see product_segments).
+def product_axis(start_date, codes, resolution='D', tz=None):
+    with profiling.stage('calendar', num_products=len(codes)):
+        bounds, cover = product_segments(*product_bounds(start_date, codes))
+        return axis.bounds_axis(bounds, resolution, tz), cover
+
+@functools.lru_cache(maxsize=PRODUCT_PLAN_CACHE_SIZE)
+def _cached_product_plan(start_date, codes, resolution, tz):
+    period, cover = product_axis(start_date, codes, resolution, tz)
+    cover.flags.writeable = False
+    plan = builder.CurvePlan(start_date, len(period.lengths), resolution, tz, period_axis=period)
+    return plan, cover
+
+# Returns a builder.CurvePlan over the segments of the products and the matrix of which
+# segments each product covers, from a least recently used cache of the last
+# PRODUCT_PLAN_CACHE_SIZE plans. Only the date of start_date is part of the key.
+def product_plan(start_date, codes, resolution='D', tz=None):
+    start_date = datetime(start_date.year, start_date.month, start_date.day)
+    return _cached_product_plan(start_date, tuple(codes), resolution, tz)
+
+def clear_product_plan_cache():
+    _cached_product_plan.cache_clear()
+
+# Builds the smooth curve for a strip of products with one price per product code, e.g.
+# build_product_curve([30, 32, 35, 33], ['DA', 'BOM', 'M+1', 'Q+1']). Overlapping products
+# are split into non-overlapping segments (see segment_prices), and the whole strip is
+# solved as one system. Returns the same as builder.build_smfc_curve, with the segments as
+# the date ranges and the segment prices as y.
+def build_product_curve(prices, codes, start_date=None, flatten=True, corr_avg=False, resolution='D', tz=None,
+                        output='lists', tol=1e-6):
+    with profiling.build('build_product_curve'):
+        if start_date is None:
+            start_date = datetime.now()
+        if output not in ('lists', 'arrays', 'curve'):
+            raise ValueError('Unknown output "{}". Use "lists", "arrays" or "curve"'.format(output))
+        plan, cover = product_plan(start_date, codes, resolution, tz)
+        y = segment_prices(cover, plan.lengths, prices, tol)
+        if output == 'curve':
+            from curvy.curve import Curve
+            return Curve.from_period_axis(plan.solve(y, exact_avg=corr_avg), plan.axis, resolution)
+        x, y_steps, dr, pr = plan.get_ranges(y) if output == 'lists' else plan.get_arrays(y)
+        y_smfc = plan.calc_smfc(y, flatten, exact_avg=corr_avg)
+        return x, y_steps, dr, pr, y_smfc
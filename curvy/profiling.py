@@ -0,0 +1,156 @@
+import contextlib
+import sys
+import threading
+import time
+import tracemalloc
+import numpy as np
+
+# Opt-in instrumentation of the curve builder. The builder marks its stages (calendar,
+# assembly, factorize, solve and evaluate) with stage(), and each call to a build function
+# with build(). Nothing is recorded, and stage() only costs a function call, unless a
+# Profile is active or a callback is registered.
+#
+# Ex:
+# with profiling.profile() as prof:
+#     builder.build_smfc_curve(prices, start_date)
+# prof.summary()
+
+_profiles = []
+_callbacks = []
+_lock = threading.Lock()
+_local = threading.local()
+_null = contextlib.nullcontext()
+
+# Returns True if stages are recorded.
+def enabled():
+    return bool(_profiles or _callbacks)
+
+# Registers a function that is called with the record of every build (see build), e.g.
+# to send the stage timings to a metrics system.
+def add_callback(callback):
+    with _lock:
+        _callbacks.append(callback)
+
+def remove_callback(callback):
+    with _lock:
+        _callbacks.remove(callback)
+
+def _current():
+    return getattr(_local, 'record', None)
+
+# Marks a stage of the builder. Records the wall time, the net number of allocated memory
+# blocks, the peak traced memory (if tracemalloc is tracing) and the given sizes (e.g.
+# the shape of a matrix) into the record of the build it is part of.
+def stage(name, **sizes):
+    if not (_profiles or _callbacks):
+        return _null
+    return _stage(name, sizes)
+
+@contextlib.contextmanager
+def _stage(name, sizes):
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        memory_start = tracemalloc.get_traced_memory()[0]
+    blocks = sys.getallocatedblocks()
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        entry = {
+            'stage': name,
+            'time': time.perf_counter() - start,
+            'blocks': sys.getallocatedblocks() - blocks,
+        }
+        if tracing:
+            entry['peak_memory'] = tracemalloc.get_traced_memory()[1] - memory_start
+        entry.update(sizes)
+        record = _current()
+        if record is not None:
+            record['stages'].append(entry)
+        else:
+            _finish({'build': None, 'time': entry['time'], 'stages': [entry]})
+
+# Marks a call to a build function. All stages inside it are collected into one record,
+# which is passed to the active profiles and callbacks when the build is done. Nested
+# builds are part of the outermost one.
+def build(name):
+    if not (_profiles or _callbacks) or _current() is not None:
+        return _null
+    return _build(name)
+
+@contextlib.contextmanager
+def _build(name):
+    record = {'build': name, 'stages': []}
+    _local.record = record
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['time'] = time.perf_counter() - start
+        _local.record = None
+        _finish(record)
+
+def _finish(record):
+    with _lock:
+        profiles, callbacks = list(_profiles), list(_callbacks)
+    for profile in profiles:
+        profile.records.append(record)
+    for callback in callbacks:
+        callback(record)
+
+# Collects the records of all builds while it is active.
+class Profile:
+    def __init__(self):
+        self.records = []
+
+    # Returns the count, total, mean, min and max time and the total allocated blocks of
+    # each stage (and of each build function, as 'build:<name>').
+    def summary(self):
+        times = {}
+        blocks = {}
+        for record in self.records:
+            if record['build'] is not None:
+                times.setdefault('build:' + record['build'], []).append(record['time'])
+            for entry in record['stages']:
+                times.setdefault(entry['stage'], []).append(entry['time'])
+                blocks[entry['stage']] = blocks.get(entry['stage'], 0) + entry['blocks']
+        summary = {}
+        for name, values in times.items():
+            values = np.array(values)
+            summary[name] = {
+                'count': len(values),
+                'total': values.sum(),
+                'mean': values.mean(),
+                'min': values.min(),
+                'max': values.max(),
+            }
+            if name in blocks:
+                summary[name]['blocks'] = blocks[name]
+        return summary
+
+    # Returns one flat dict per stage, for exporting to a metrics system.
+    def to_rows(self):
+        rows = []
+        for i, record in enumerate(self.records):
+            for entry in record['stages']:
+                rows.append(dict(entry, build=record['build'], build_index=i))
+        return rows
+
+# Activates a Profile for the duration of the with block. With trace_memory=True,
+# tracemalloc is started as well so the peak memory of each stage is recorded.
+@contextlib.contextmanager
+def profile(trace_memory=False):
+    prof = Profile()
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    with _lock:
+        _profiles.append(prof)
+    try:
+        yield prof
+    finally:
+        with _lock:
+            _profiles.remove(prof)
+        if started:
+            tracemalloc.stop()
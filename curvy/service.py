@@ -0,0 +1,255 @@
+import asyncio
+import collections
+import json
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from curvy import builder, parallel
+
+# Number of latencies kept for the latency metrics.
+LATENCY_WINDOW = 10000
+
+# Builds the curves for a batch of prices on the same plan. Runs in the executor, so it
+# is a module level function that can be sent to a process pool as well.
+def _solve_batch(prices, start_date, corr_avg, resolution, tz):
+    plan = builder.get_plan(start_date, prices.shape[1], resolution, tz)
+    X = plan.solve(prices, exact_avg=corr_avg)
+    return plan.axis.dates, builder.batch_segment_values(plan.lengths, X, local=True)
+
+# Serves curve builds to many clients from one asyncio event loop. Requests for the same
+# prices and start date that arrive while one is being built share its result, and
+# requests on the same plan (see parallel.plan_key) that arrive within batch_window seconds
+# are built together as one multi price solve in the executor (a thread pool by default).
+# Ex:
+# service = CurveService()
+# dates, values = await service.build(prices, start_date)
+class CurveService:
+    def __init__(self, executor=None, batch_window=0.002, max_batch=256):
+        if max_batch < 1:
+            raise ValueError('The max_batch must be at least 1')
+        self._own_executor = executor is None
+        self.executor = ThreadPoolExecutor() if executor is None else executor
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        # Futures of the requests that are being built, by prices and plan.
+        self._in_flight = {}
+        # Requests waiting to be sent to the executor, by plan.
+        self._pending = {}
+        self._timers = {}
+        self._running = 0
+        # Batches being built, kept so the tasks are not garbage collected while they run.
+        self._tasks = set()
+        self._counts = collections.Counter()
+        self._latencies = collections.deque(maxlen=LATENCY_WINDOW)
+
+    # Returns the dates and curve values for the prices, as arrays. The arrays may be shared
+    # with other requests and are read-only.
+    async def build(self, prices, start_date, corr_avg=False, resolution='D', tz=None):
+        start = time.perf_counter()
+        self._counts['requests'] += 1
+        prices = tuple(float(p) for p in prices)
+        if len(prices) < 2:
+            self._counts['errors'] += 1
+            raise ValueError('The price list must contain at least 2 values')
+        batch_key = parallel.plan_key(start_date, len(prices), resolution, tz) + (bool(corr_avg),)
+        key = batch_key + (prices,)
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+            self._in_flight[key] = future
+            self._enqueue(batch_key, key, future)
+        else:
+            self._counts['coalesced'] += 1
+        try:
+            return await asyncio.shield(future)
+        finally:
+            self._latencies.append(time.perf_counter() - start)
+
+    def _enqueue(self, batch_key, key, future):
+        pending = self._pending.setdefault(batch_key, [])
+        pending.append((key, future))
+        if len(pending) >= self.max_batch:
+            self._flush(batch_key)
+        elif batch_key not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[batch_key] = loop.call_later(self.batch_window, self._flush, batch_key)
+
+    def _flush(self, batch_key):
+        timer = self._timers.pop(batch_key, None)
+        if timer is not None:
+            timer.cancel()
+        batch = self._pending.pop(batch_key, [])
+        if batch:
+            self._running += len(batch)
+            task = asyncio.ensure_future(self._run_batch(batch_key, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run_batch(self, batch_key, batch):
+        day, num_periods, resolution, tz, corr_avg = batch_key
+        prices = np.array([key[-1] for key, future in batch], dtype='float64')
+        start_date = datetime(day.year, day.month, day.day)
+        self._counts['batches'] += 1
+        self._counts['batched_requests'] += len(batch)
+        loop = asyncio.get_running_loop()
+        try:
+            dates, values = await loop.run_in_executor(
+                self.executor, _solve_batch, prices, start_date, corr_avg, resolution, tz
+            )
+            values.flags.writeable = False
+            for i, (key, future) in enumerate(batch):
+                if not future.done():
+                    future.set_result((dates, values[i]))
+        except Exception as e:
+            self._counts['errors'] += len(batch)
+            for key, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            self._running -= len(batch)
+            for key, future in batch:
+                self._in_flight.pop(key, None)
+
+    # Number of requests waiting for a batch or being built.
+    @property
+    def queue_depth(self):
+        return sum(len(batch) for batch in self._pending.values()) + self._running
+
+    # Returns the request counts, the mean batch size, the queue depth and the latency
+    # percentiles (in seconds) of the last LATENCY_WINDOW requests.
+    def metrics(self):
+        metrics = {
+            'requests': self._counts['requests'],
+            'coalesced': self._counts['coalesced'],
+            'batches': self._counts['batches'],
+            'errors': self._counts['errors'],
+            'mean_batch_size': self._counts['batched_requests'] / max(self._counts['batches'], 1),
+            'queue_depth': self.queue_depth,
+            'in_flight': len(self._in_flight),
+        }
+        if self._latencies:
+            p50, p95, p99 = np.percentile(self._latencies, [50, 95, 99])
+            metrics.update(latency_p50=p50, latency_p95=p95, latency_p99=p99, latency_max=max(self._latencies))
+        return metrics
+
+    # Handles one decoded message of the socket protocol and returns the response. A build
+    # request is {'prices': [...], 'start_date': '2018-11-26', 'corr_avg': false,
+    # 'resolution': 'D', 'tz': null} and returns {'dates': [...], 'values': [...]}, while
+    # {'metrics': true} returns the metrics. Errors, also for messages that are not a JSON
+    # object, are returned as {'error': message}.
+    async def handle(self, message):
+        if not isinstance(message, dict):
+            return {'error': 'The message must be a JSON object'}
+        try:
+            if message.get('metrics'):
+                return {'metrics': self.metrics()}
+            dates, values = await self.build(
+                message['prices'], datetime.fromisoformat(message['start_date']), message.get('corr_avg', False),
+                message.get('resolution', 'D'), message.get('tz'),
+            )
+            return {'dates': np.datetime_as_string(dates).tolist(), 'values': values.tolist()}
+        except Exception as e:
+            return {'error': '{}: {}'.format(type(e).__name__, e)}
+
+    # Serves the socket protocol: one JSON message per line, answered by one JSON line.
+    # Requests on the same connection are handled concurrently, and answered in order. A
+    # request that fails is answered with an error, so the connection is kept open.
+    async def _serve_connection(self, reader, writer):
+        responses = asyncio.Queue()
+
+        async def write_responses():
+            while True:
+                response = await responses.get()
+                if response is None:
+                    break
+                try:
+                    message = json.dumps(await response)
+                except Exception as e:
+                    message = json.dumps({'error': '{}: {}'.format(type(e).__name__, e)})
+                writer.write(message.encode() + b'\n')
+                await writer.drain()
+
+        writer_task = asyncio.ensure_future(write_responses())
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    message = json.loads(line)
+                except ValueError as e:
+                    message = None
+                    response = asyncio.get_running_loop().create_future()
+                    response.set_result({'error': 'Invalid JSON: {}'.format(e)})
+                if message is not None:
+                    response = asyncio.ensure_future(self.handle(message))
+                await responses.put(response)
+        finally:
+            await responses.put(None)
+            await writer_task
+            writer.close()
+
+    # Starts a TCP server for the socket protocol and returns the asyncio.Server.
+    async def start_server(self, host='127.0.0.1', port=8765):
+        return await asyncio.start_server(self._serve_connection, host, port)
+
+    def close(self):
+        for timer in self._timers.values():
+            timer.cancel()
+        if self._own_executor:
+            self.executor.shutdown()
+
+# Runs a CurveService on host and port until interrupted.
+def serve(host='127.0.0.1', port=8765, batch_window=0.002, max_batch=256):
+    async def run():
+        service = CurveService(batch_window=batch_window, max_batch=max_batch)
+        server = await service.start_server(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            service.close()
+    asyncio.run(run())
+
+# Stand-in for a socket client that sends the messages straight to a service in the same
+# event loop, with the same JSON encoding as the socket protocol.
+class LocalClient:
+    def __init__(self, service):
+        self.service = service
+
+    async def request(self, message):
+        response = await self.service.handle(json.loads(json.dumps(message)))
+        return json.loads(json.dumps(response))
+
+    async def build(self, prices, start_date, corr_avg=False, resolution='D', tz=None):
+        return await self.request({
+            'prices': list(prices), 'start_date': start_date.isoformat(), 'corr_avg': corr_avg,
+            'resolution': resolution, 'tz': tz,
+        })
+
+    async def metrics(self):
+        return (await self.request({'metrics': True}))['metrics']
+
+# Client for the socket protocol of CurveService.start_server.
+class SocketClient(LocalClient):
+    def __init__(self, host='127.0.0.1', port=8765):
+        self.host = host
+        self.port = port
+        self._reader = None
+        self._writer = None
+        self._lock = None
+
+    async def request(self, message):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            self._writer.write(json.dumps(message).encode() + b'\n')
+            await self._writer.drain()
+            return json.loads(await self._reader.readline())
+
+    async def close(self):
+        if self._writer is not None:
+            self._writer.close()
+            await self._writer.wait_closed()
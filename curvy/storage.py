@@ -0,0 +1,186 @@
+import json
+import mmap
+import os
+import struct
+import numpy as np
+from collections import namedtuple
+from curvy.curve import Curve
+
+# Binary format for curves, storing the parameters of each segment instead of the curve
+# values. A file is a sequence of records, one per curve, so a single curve is an archive
+# with one record and more curves can be appended at any time. Each record is:
+# - a fixed prefix (RECORD_PREFIX): the magic bytes, the format version, the length of the
+#   header and the number of segments
+# - a JSON header with the origin and step of the curve, the key and the metadata,
+#   padded with spaces to a multiple of 8 bytes
+# - the parameters (num_segments x 5), the breakpoints (num_segments + 1) and, if stored,
+#   the prices (num_segments) as little endian float64
+# The arrays are read straight from a memory map of the file, and curve values are only
+# calculated when the curve is called. A partial record at the end of the file, left by an
+# interrupted append, is ignored when reading and removed before the next append.
+MAGIC = b'CRVY'
+VERSION = 1
+RECORD_PREFIX = struct.Struct('<4sHHII')
+
+# A curve read from an archive, with its prices (or None) and metadata.
+CurveRecord = namedtuple('CurveRecord', ['curve', 'prices', 'key', 'metadata'])
+
+def _encode_record(curve, prices=None, key=None, metadata=None):
+    num_segments = len(curve.params)
+    if prices is not None:
+        prices = np.asarray(prices, dtype='<f8')
+        if len(prices) != num_segments:
+            raise ValueError('There must be one price per segment')
+    header = {'key': key, 'metadata': metadata or {}, 'has_prices': prices is not None}
+    if curve.origin is not None:
+        origin = np.datetime64(curve.origin)
+        step = np.timedelta64(curve.step)
+        header['origin'] = [str(origin), np.datetime_data(origin.dtype)[0]]
+        header['step'] = [int(step.astype('int64')), np.datetime_data(step.dtype)[0]]
+    encoded = json.dumps(header).encode()
+    encoded += b' ' * (-len(encoded) % 8)
+    parts = [
+        RECORD_PREFIX.pack(MAGIC, VERSION, 0, len(encoded), num_segments), encoded,
+        np.asarray(curve.params, dtype='<f8').tobytes(), np.asarray(curve.breakpoints, dtype='<f8').tobytes(),
+    ]
+    if prices is not None:
+        parts.append(prices.tobytes())
+    return b''.join(parts)
+
+# An appendable archive of curves in one file. Records are read lazily from a memory map
+# and can be looked up by position or by key.
+# Ex:
+# with CurveArchive('curves.crvy') as archive:
+#     archive.append(curve, prices, key='NO1 2018-11-26')
+#     curve = archive['NO1 2018-11-26'].curve
+class CurveArchive:
+    def __init__(self, path):
+        self.path = path
+        self._mmap = None
+        self._offsets = None
+        self._keys = None
+        self._end = 0
+
+    def _open(self):
+        if self._offsets is not None:
+            return
+        self._offsets = []
+        self._keys = {}
+        if not os.path.exists(self.path) or os.path.getsize(self.path) == 0:
+            return
+        with open(self.path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        while self._end < len(self._mmap):
+            record = self._read_record(self._end)
+            if record is None:
+                break
+            header, num_segments, data_offset, end = record
+            if header['key'] is not None:
+                self._keys[header['key']] = len(self._offsets)
+            self._offsets.append(self._end)
+            self._end = end
+
+    # Returns the header, the number of segments, the offset of the arrays and the end of
+    # the record at offset, or None if the record does not fit in the file.
+    def _read_record(self, offset):
+        size = len(self._mmap)
+        if offset + RECORD_PREFIX.size > size:
+            return None
+        magic, version, _, header_length, num_segments = RECORD_PREFIX.unpack_from(self._mmap, offset)
+        if magic != MAGIC:
+            raise ValueError('{} is not a curve archive, or is corrupt at byte {}'.format(self.path, offset))
+        if version > VERSION:
+            raise ValueError('Unsupported curve format version {}'.format(version))
+        start = offset + RECORD_PREFIX.size
+        if start + header_length > size:
+            return None
+        header = json.loads(bytes(self._mmap[start:start + header_length]))
+        data_offset = start + header_length
+        end = data_offset + 8 * (num_segments * (7 if header['has_prices'] else 6) + 1)
+        if end > size:
+            return None
+        return header, num_segments, data_offset, end
+
+    # Removes a partial record at the end of the file, so new records are written right
+    # after the last complete one.
+    def _truncate_partial(self):
+        self.close()
+        self._open()
+        size = 0 if self._mmap is None else len(self._mmap)
+        end = self._end
+        self.close()
+        if end < size:
+            os.truncate(self.path, end)
+
+    # Appends a curve, with its prices, a key and JSON serializable metadata.
+    def append(self, curve, prices=None, key=None, metadata=None):
+        record = _encode_record(curve, prices, key, metadata)
+        self._truncate_partial()
+        with open(self.path, 'ab') as f:
+            f.write(record)
+
+    # Appends many curves at once. The records are (curve, prices, key, metadata) tuples.
+    def extend(self, records):
+        self._truncate_partial()
+        with open(self.path, 'ab') as f:
+            for curve, prices, key, metadata in records:
+                f.write(_encode_record(curve, prices, key, metadata))
+
+    def __len__(self):
+        self._open()
+        return len(self._offsets)
+
+    def keys(self):
+        self._open()
+        return list(self._keys)
+
+    # Returns the CurveRecord at a position or with a key. The arrays of the curve and the
+    # prices are read-only views of the memory map.
+    def __getitem__(self, index):
+        self._open()
+        if not isinstance(index, (int, np.integer)):
+            index = self._keys[index]
+        offset = self._offsets[index]
+        header, num_segments, data_offset, end = self._read_record(offset)
+        arrays = np.frombuffer(self._mmap, dtype='<f8', offset=data_offset,
+                               count=num_segments * (7 if header['has_prices'] else 6) + 1)
+        params = arrays[:5 * num_segments].reshape(-1, 5)
+        breakpoints = arrays[5 * num_segments:6 * num_segments + 1]
+        prices = arrays[6 * num_segments + 1:] if header['has_prices'] else None
+        origin = step = None
+        if 'origin' in header:
+            origin = np.datetime64(*header['origin'])
+            step = np.timedelta64(*header['step'])
+        return CurveRecord(Curve(params, breakpoints, origin, step), prices, header['key'], header['metadata'])
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    # Closes the memory map. The records read before stay valid until they are released.
+    def close(self):
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # Arrays of records still point into the map, it is closed when they are gone.
+                pass
+        self._mmap = None
+        self._offsets = None
+        self._keys = None
+        self._end = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# Writes a single curve to a new file.
+def save_curve(path, curve, prices=None, key=None, metadata=None):
+    with open(path, 'wb') as f:
+        f.write(_encode_record(curve, prices, key, metadata))
+
+# Reads the first curve in a file as a CurveRecord.
+def load_curve(path):
+    return CurveArchive(path)[0]
@@ -4,6 +4,7 @@ setup(
     name='curvy',
     version='0.1dev',
     packages=['curvy',],
+    python_requires='>=3.9',
     license='MIT',
     long_description=open('README.md').read(),
     keyswords='smooth curve curves interpolation swap forward prices price python forecast spline electricity gas market maximum smoothness',
@@ -14,5 +15,11 @@ setup(
         'scipy',
         'pandas',
 #        'matplotlib'
-    ]
+    ],
+    extras_require={
+        'parquet': ['pyarrow'],
+    },
+    entry_points={
+        'console_scripts': ['curvy = curvy.cli:main'],
+    },
 )
\ No newline at end of file
@@ -1,6 +1,7 @@
 import unittest
 from curvy import axis
 import datetime
+import numpy as np
 
 class TestAxisMethods(unittest.TestCase):
 
@@ -67,6 +68,60 @@ class TestAxisMethods(unittest.TestCase):
             ]
         )
 
+    def test_period_axis(self):
+        period = axis.period_axis(datetime.datetime(2018, 11, 26), 2)
+        self.assertEqual(period.dates.dtype, np.dtype('datetime64[D]'))
+        self.assertEqual(period.dates[0], np.datetime64('2018-11-27'))
+        self.assertEqual(period.dates[-1], np.datetime64('2019-01-31'))
+        np.testing.assert_array_equal(period.starts, [0, 1, 4, 35])
+        np.testing.assert_array_equal(period.lengths, [1, 3, 31, 31])
+
+        # No BOM when the start date is two days before the end of the month
+        period = axis.period_axis(datetime.datetime(2018, 11, 29), 1)
+        np.testing.assert_array_equal(period.lengths, [1, 31])
+
+        self.assertEqual(
+            axis.axis_ranges(period),
+            axis.date_ranges(datetime.datetime(2018, 11, 29), 1)
+        )
+        self.assertEqual(axis.strip_eoms(datetime.datetime(2018, 11, 29), 4), 3)
+        self.assertEqual(axis.strip_eoms(datetime.datetime(2018, 11, 26), 4), 2)
+
+    def test_period_axis_resolution(self):
+        period = axis.period_axis(datetime.datetime(2018, 11, 26), 1, resolution='h')
+        self.assertEqual(period.dates[0], np.datetime64('2018-11-27T00:00'))
+        np.testing.assert_array_equal(period.lengths, [24, 72, 744])
+        np.testing.assert_array_equal(period.starts, [0, 24, 96])
+
+        period = axis.period_axis(datetime.datetime(2018, 11, 26), 1, resolution='15min')
+        np.testing.assert_array_equal(period.lengths, [96, 288, 2976])
+
+        # Daylight saving time: one hour less in March and one more in October
+        period = axis.period_axis(datetime.datetime(2019, 2, 20), 9, resolution='h', tz='Europe/Oslo')
+        self.assertEqual(period.dates[0], np.datetime64('2019-02-20T23:00'))
+        np.testing.assert_array_equal(period.lengths[2:4], [743, 720])
+        self.assertEqual(period.lengths[9], 745)
+
+        with self.assertRaises(ValueError):
+            axis.period_axis(datetime.datetime(2018, 11, 26), 1, resolution='W')
+
+    def test_get_arrays(self):
+        x, y, dr, pr = axis.get_arrays(datetime.datetime(2018, 11, 26), [1, 2, 3])
+        x_list, y_list, dr_list, pr_list = axis.get_ranges(datetime.datetime(2018, 11, 26), [1, 2, 3])
+        self.assertEqual(x.tolist(), x_list)
+        self.assertEqual(y.tolist(), y_list)
+        self.assertEqual([r.tolist() for r in dr], dr_list)
+        self.assertEqual([r.tolist() for r in pr], pr_list)
+
+    def test_price_array(self):
+        np.testing.assert_array_equal(
+            axis.price_array([3, 2], [1, 2]),
+            [1, 1, 1, 2, 2]
+        )
+
+        with self.assertRaises(ValueError):
+            axis.price_array([3, 2], [1, 2, 3])
+
     def test_price_ranges(self):
         self.assertEqual(
             axis.price_ranges([[1,2,3]], [4]), 
@@ -146,6 +201,28 @@ class TestAxisMethods(unittest.TestCase):
         )
 
 
+    def test_start_end_index_array(self):
+        np.testing.assert_array_equal(
+            axis.start_end_index_array([3, 4]),
+            [[0, 2], [3, 6]]
+        )
+
+        np.testing.assert_array_equal(
+            axis.start_end_index_array([3, 4], overlap=1),
+            [[0, 3], [3, 7]]
+        )
+
+    def test_midpoint_index_array(self):
+        np.testing.assert_array_equal(
+            axis.midpoint_index_array([3, 4]),
+            [1, 5]
+        )
+
+        np.testing.assert_array_equal(
+            axis.midpoint_index_array([3, 4], include_last=True),
+            [1, 5, 6]
+        )
+
     def test_full_index(self):
         self.assertEqual(
             axis.full_index([[0,1]]),
@@ -174,6 +251,15 @@ class TestAxisMethods(unittest.TestCase):
                 [2]
             )
 
+    def test_knot_index_array(self):
+        np.testing.assert_array_equal(
+            axis.knot_index_array([[1,2],[2,6],[6,10]]),
+            [2,6]
+        )
+
+        with self.assertRaises(ValueError):
+            axis.knot_index_array([[1,2]])
+
     def test_get_ranges(self):
         with self.assertRaises(ValueError):
             self.assertEqual(
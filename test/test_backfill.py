@@ -0,0 +1,64 @@
+import unittest
+import os
+import tempfile
+from curvy import backfill, builder, storage
+import datetime
+import numpy as np
+
+class TestBackfillMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'history.crvy')
+        self.dates = np.arange(np.datetime64('2017-01-01'), np.datetime64('2019-01-01'))
+        rng = np.random.default_rng(0)
+        self.prices = [30 + 5 * rng.random(8) for _ in self.dates]
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_date_signature(self):
+        first, lengths = backfill.date_signature(datetime.datetime(2018, 11, 26), 4)
+        self.assertEqual(first, np.datetime64('2018-11-27'))
+        self.assertEqual(lengths, (1, 3, 31, 31))
+        # No BOM on the last but one day of the month.
+        first, lengths = backfill.date_signature(datetime.datetime(2018, 11, 29), 4)
+        self.assertEqual(lengths, (1, 31, 31, 28))
+        # The same periods as the builder.
+        plan = builder.get_plan(datetime.datetime(2018, 11, 29), 4)
+        self.assertEqual(tuple(plan.lengths), lengths)
+        self.assertEqual(plan.axis.dates[0], first)
+        first, lengths = backfill.date_signature(datetime.datetime(2018, 11, 26), 4, resolution='h', tz='Europe/Oslo')
+        self.assertEqual(first, np.datetime64('2018-11-26T23:00'))
+        self.assertEqual(lengths, (24, 72, 744, 744))
+
+    def test_backfill(self):
+        result = backfill.backfill(self.dates, self.prices, self.path, metadata={'area': 'NO1'})
+        self.assertEqual(result['curves'], len(self.dates))
+        self.assertLess(result['signatures'], len(self.dates))
+        with storage.CurveArchive(self.path) as archive:
+            self.assertEqual(len(archive), len(self.dates))
+            record = archive['2018-11-26']
+            self.assertEqual(record.metadata['area'], 'NO1')
+            i = int(np.flatnonzero(self.dates == np.datetime64('2018-11-26'))[0])
+            np.testing.assert_array_equal(record.prices, self.prices[i])
+            y_smfc = builder.build_smfc_curve(list(self.prices[i]), datetime.datetime(2018, 11, 26))[4]
+            np.testing.assert_array_almost_equal(record.curve.values(), y_smfc)
+            self.assertEqual(record.curve.origin, np.datetime64('2018-11-27'))
+        # The archive can be appended to.
+        backfill.backfill(self.dates[:10], self.prices[:10], self.path)
+        self.assertEqual(len(storage.CurveArchive(self.path)), len(self.dates) + 10)
+
+    def test_backfill_corr_avg(self):
+        backfill.backfill(self.dates[:40], self.prices[:40], self.path, corr_avg=True, batch_size=3)
+        record = storage.CurveArchive(self.path)[5]
+        values = record.curve.values()
+        starts = record.curve.breakpoints[:-1].astype('int64')
+        np.testing.assert_array_almost_equal(np.add.reduceat(values, starts) / record.curve.widths, record.prices)
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            backfill.backfill(self.dates, self.prices[:-1], self.path)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -23,6 +23,22 @@ class TestBuilderMethods(unittest.TestCase):
             big_H
         )
 
+    def test_calc_H_blocks(self):
+        blocks = builder.calc_H_blocks(taus)
+        self.assertEqual(blocks.shape, (3, 5, 5))
+        self.assertEqual(blocks.dtype, np.float64)
+        for i, (tau_b, tau_e) in enumerate(taus):
+            np.testing.assert_array_equal(blocks[i], builder.calc_H(tau_b, tau_e))
+
+    def test_power_table(self):
+        np.testing.assert_array_equal(
+            builder.power_table([2, 3], 2),
+            [[1, 2, 4], [1, 3, 9]]
+        )
+
+        # No integer overflow for large indices
+        self.assertEqual(builder.power_table([10**5], 5)[0, 5], 1e25)
+
     def test_avg_constraint(self):
         avg_constraint = np.load('test/test_files/avg_constraint.npy')
         np.testing.assert_array_equal(
@@ -30,6 +46,12 @@ class TestBuilderMethods(unittest.TestCase):
             avg_constraint
         )
 
+    def test_calc_discrete_avg_constraints(self):
+        np.testing.assert_array_equal(
+            builder.calc_discrete_avg_constraints(taus),
+            [[sum(u**k for u in range(tau_b, tau_e)) for k in range(4, -1, -1)] for tau_b, tau_e in taus]
+        )
+
     def test_calc_constraints(self):
         constraints = np.load('test/test_files/constraints.npy')
         np.testing.assert_array_equal(
@@ -51,6 +73,16 @@ class TestBuilderMethods(unittest.TestCase):
             B
         )
 
+    def test_calc_batch_B(self):
+        B = np.load('test/test_files/B.npy')
+        np.testing.assert_array_equal(
+            builder.calc_batch_B([prices, [2 * p for p in prices]], taus),
+            np.hstack((B, 2 * B))
+        )
+
+        with self.assertRaises(ValueError):
+            builder.calc_batch_B(prices, taus)
+
     def test_solve_lineq(self):
         lineq_ans = np.load('test/test_files/lineq_ans.npy')
         lineq_ans = [arr for arr in lineq_ans]
@@ -75,6 +107,74 @@ class TestBuilderMethods(unittest.TestCase):
             lineq_ans_no_split
         )
 
+    def test_kkt_band_order(self):
+        np.testing.assert_array_equal(
+            builder.kkt_band_order(2),
+            [0, 1, 2, 3, 4, 9, 10, 11, 12, 13, 5, 6, 7, 8, 14]
+        )
+
+    def test_solve_banded_lineq(self):
+        lineq_ans = np.load('test/test_files/lineq_ans.npy')
+        lineq_ans = [arr for arr in lineq_ans]
+
+        np.testing.assert_array_almost_equal(
+            builder.solve_banded_lineq(knots, taus, builder.calc_B(prices, taus)),
+            lineq_ans
+        )
+
+        lineq_ans_no_split = np.load('test/test_files/lineq_ans_no_split.npy')
+        np.testing.assert_array_almost_equal(
+            builder.solve_banded_lineq(knots, taus, builder.calc_B(prices, taus), split=False),
+            lineq_ans_no_split
+        )
+
+    def test_calc_smfc_banded_matches_dense(self):
+        prices2 = [2,4,7,5,4,3,2,3,4,5,6,5,4,3]
+        dr = axis.date_ranges(datetime.datetime(2018,11,26), 12)
+        np.testing.assert_allclose(
+            builder.calc_smfc(dr, prices2, method='banded'),
+            builder.calc_smfc(dr, prices2, method='dense'),
+            rtol=1e-7
+        )
+
+        with self.assertRaises(ValueError):
+            builder.calc_smfc(dr, prices2, method='sparse')
+
+    def test_local_coordinates(self):
+        B = builder.calc_B(prices, taus, local=True)
+        np.testing.assert_array_equal(B[builder.avg_constraint_rows(3), 0], prices)
+
+        X_dense = builder.solve_lineq(
+            builder.calc_big_H(taus, local=True),
+            builder.calc_big_A(knots, taus, local=True),
+            B
+        )
+        X_banded = builder.solve_banded_lineq(knots, taus, B, local=True)
+        np.testing.assert_array_almost_equal(X_dense, X_banded)
+
+        ranges = [[0, 1, 2], [3, 4], [5, 6, 7, 8]]
+        taus2 = axis.start_end_absolute_index(ranges, overlap=1)
+        knots2 = axis.knot_index(taus2)
+        X_absolute = builder.solve_banded_lineq(knots2, taus2, builder.calc_B(prices, taus2))
+        X_local = builder.solve_banded_lineq(knots2, taus2, builder.calc_B(prices, taus2, local=True), local=True)
+        np.testing.assert_array_almost_equal(
+            builder.curve_values(ranges, X_local, builder.smfc, flatten=True, local=True),
+            builder.curve_values(ranges, X_absolute, builder.smfc, flatten=True)
+        )
+
+    def test_condition_number(self):
+        dr = axis.date_ranges(datetime.datetime(2018,11,26), 36, resolution='h')
+        taus_h = axis.start_end_index_array(axis.range_lengths(dr), overlap=1)
+        knots_h = axis.knot_index_array(taus_h)
+        self.assertLess(
+            builder.KKTFactorization(knots_h, taus_h, local=True).condition_number(),
+            1e10
+        )
+        self.assertGreater(
+            builder.KKTFactorization(knots_h, taus_h).condition_number(),
+            1e30
+        )
+
     def test_smfc(self):
         self.assertEqual(
             builder.smfc(2, [2,3,4,5,6]),
@@ -119,6 +219,149 @@ class TestBuilderMethods(unittest.TestCase):
         for i in range (0, len(test_curve_values)):
             np.testing.assert_array_almost_equal(test_curve_values[i], curve_values_flat[i])
 
+    def test_build_smfc_curves(self):
+        prices_matrix = [[2,4,7,5,4,3,2], [3,3,5,6,4,4,5], [1,2,3,4,5,6,7]]
+        start_date = datetime.datetime(2018,11,26)
+        x, dr, y_smfc = builder.build_smfc_curves(prices_matrix, start_date)
+
+        self.assertEqual(x, axis.flatten_ranges(axis.date_ranges(start_date, 5)))
+        self.assertEqual(y_smfc.shape, (3, len(x)))
+        for i, p in enumerate(prices_matrix):
+            np.testing.assert_array_almost_equal(
+                y_smfc[i],
+                builder.build_smfc_curve(p, start_date)[-1]
+            )
+
+        x, dr, y_smfc = builder.build_smfc_curves(prices_matrix, start_date, corr_avg=True)
+        for i, p in enumerate(prices_matrix):
+            np.testing.assert_array_almost_equal(
+                y_smfc[i],
+                builder.build_smfc_curve(p, start_date, corr_avg=True)[-1]
+            )
+
+    def test_build_smfc_curve_no_bom(self):
+        # On the last but one day of the month the strip is the DA and the months.
+        prices2 = [3, 4, 6, 5]
+        start_date = datetime.datetime(2018, 11, 29)
+        for method in ['banded', 'dense']:
+            x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices2, start_date, method=method, flatten=False)
+            self.assertEqual([len(r) for r in dr], [1, 31, 31, 28])
+            self.assertEqual(x[0], datetime.date(2018, 11, 30))
+
+    def test_build_smfc_curve_corr_avg(self):
+        prices2 = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6, 12, 3]
+        for method in ['banded', 'dense']:
+            x, y, dr, pr, y_smfc = builder.build_smfc_curve(
+                prices2, datetime.datetime(2018,11,26), flatten=False, corr_avg=True, method=method
+            )
+            np.testing.assert_allclose(builder.avg_diff(y_smfc, prices2), 0, atol=1e-9)
+
+    def test_build_smfc_curve_hourly(self):
+        prices2 = [30, 32, 35, 33, 31, 30, 29, 28]
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(
+            prices2, datetime.datetime(2019,2,20), flatten=False, corr_avg=True,
+            resolution='h', tz='Europe/Oslo', output='arrays'
+        )
+        self.assertEqual(x.dtype, np.dtype('datetime64[m]'))
+        self.assertEqual([len(r) for r in dr], [len(r) for r in y_smfc])
+        self.assertEqual(len(dr[2]), 743)
+        np.testing.assert_allclose(builder.avg_diff(y_smfc, prices2), 0, atol=1e-8)
+
+        with self.assertRaises(ValueError):
+            builder.build_smfc_curve(prices2, datetime.datetime(2019,2,20), output='frame')
+
+    def test_build_smfc_curves_out(self):
+        prices_matrix = [[2,4,7,5,4,3,2], [3,3,5,6,4,4,5]]
+        start_date = datetime.datetime(2018,11,26)
+        x, dr, y_smfc = builder.build_smfc_curves(prices_matrix, start_date)
+
+        out = np.zeros((2, len(x)))
+        x, dr, y_out = builder.build_smfc_curves(prices_matrix, start_date, out=out, chunk_size=7)
+        self.assertIs(y_out, out)
+        np.testing.assert_array_almost_equal(out, y_smfc)
+
+        with self.assertRaises(ValueError):
+            builder.build_smfc_curves(prices_matrix, start_date, out=np.zeros((3, len(x))))
+
+    def test_iter_smfc_curve(self):
+        prices2 = [2,4,7,5,4,3,2]
+        start_date = datetime.datetime(2018,11,26)
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices2, start_date, output='arrays')
+        chunks = list(builder.iter_smfc_curve(prices2, start_date, chunk_size=40))
+        self.assertEqual([len(values) for dates, values in chunks], [40, 40, 40, 35])
+        np.testing.assert_array_equal(np.concatenate([dates for dates, values in chunks]), x)
+        np.testing.assert_array_almost_equal(np.concatenate([values for dates, values in chunks]), y_smfc)
+
+    def test_get_plan(self):
+        builder.clear_plan_cache()
+        prices2 = [2,4,7,5,4,3,2]
+        plan = builder.get_plan(datetime.datetime(2018,11,26,8,30), len(prices2))
+        self.assertIs(plan, builder.get_plan(datetime.datetime(2018,11,26,16,0), len(prices2)))
+        self.assertIsNot(plan, builder.get_plan(datetime.datetime(2018,11,27), len(prices2)))
+
+        info = builder.plan_cache_info()
+        self.assertEqual((info.hits, info.misses, info.currsize), (1, 2, 2))
+
+        dr = axis.date_ranges(datetime.datetime(2018,11,26), 5)
+        self.assertEqual(plan.dr, dr)
+        np.testing.assert_array_almost_equal(
+            plan.calc_smfc(prices2),
+            builder.calc_smfc(dr, prices2)
+        )
+
+        with self.assertRaises(ValueError):
+            plan.get_ranges([1, 2])
+
+        with self.assertRaises(ValueError):
+            builder.get_plan(datetime.datetime(2018,11,26), 1)
+
+        builder.clear_plan_cache()
+        self.assertEqual(builder.plan_cache_info().currsize, 0)
+
+    def test_price_influence(self):
+        start_date = datetime.datetime(2018,11,26)
+        forward_prices = np.array([3, 4, 6, 5, 7, 8, 6, 4, 5, 6], dtype='float64')
+        y_smfc = builder.build_smfc_curve(list(forward_prices), start_date)[4]
+        influence = builder.get_influence(start_date, len(forward_prices))
+        self.assertIs(influence, builder.get_influence(start_date, len(forward_prices)))
+        self.assertIsNot(influence, builder.get_plan(start_date, len(forward_prices)).influence())
+        self.assertTrue(influence.dense)
+        np.testing.assert_array_almost_equal(influence.curve(forward_prices), y_smfc)
+        # A bumped price changes the curve by the bump times its column of the matrix.
+        bumped = forward_prices.copy()
+        bumped[3] += 0.5
+        np.testing.assert_array_almost_equal(
+            builder.build_smfc_curve(list(bumped), start_date)[4], y_smfc + 0.5 * influence.matrix()[:, 3]
+        )
+        starts = builder.get_plan(start_date, len(forward_prices)).axis.starts
+        np.testing.assert_array_almost_equal(
+            influence.period_averages(forward_prices), np.add.reduceat(y_smfc, starts) / influence.lengths
+        )
+        exact = builder.get_influence(start_date, len(forward_prices), exact_avg=True)
+        np.testing.assert_array_almost_equal(exact.averages, np.eye(len(forward_prices)))
+
+        factored = builder.PriceInfluence(builder.get_plan(start_date, len(forward_prices)), max_dense_size=0)
+        self.assertFalse(factored.dense)
+        np.testing.assert_array_almost_equal(factored.curve([forward_prices, bumped])[0], y_smfc)
+        np.testing.assert_array_almost_equal(factored.matrix(), influence.matrix())
+        with self.assertRaises(ValueError):
+            influence.curve(forward_prices[:-1])
+        builder.clear_influence_cache()
+        self.assertIsNot(influence, builder.get_influence(start_date, len(forward_prices)))
+
+    def test_influence_cache(self):
+        builder.clear_influence_cache()
+        start_date = datetime.datetime(2018,11,26)
+        size = builder.INFLUENCE_CACHE_SIZE
+        influences = [builder.get_influence(start_date, 4 + i) for i in range(size)]
+        for i, influence in enumerate(influences):
+            self.assertIs(influence, builder.get_influence(start_date, 4 + i))
+        # One more evicts the least recently used.
+        builder.get_influence(start_date, 4 + size)
+        self.assertIsNot(influences[0], builder.get_influence(start_date, 4))
+        self.assertIs(influences[-1], builder.get_influence(start_date, 4 + size - 1))
+        builder.clear_influence_cache()
+
     #### This one might be harder to test 
     #
     # def test_build_smfc_curve(self):
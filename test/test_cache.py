@@ -0,0 +1,110 @@
+import unittest
+import os
+import tempfile
+from curvy import axis, builder, cache
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestCacheMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_input_key(self):
+        key = cache.input_key('f', np.array([1.0, 2.0]), 'D')
+        self.assertEqual(key, cache.input_key('f', np.array([1, 2]), 'D'))
+        self.assertNotEqual(key, cache.input_key('f', np.array([1.0, 2.5]), 'D'))
+        self.assertNotEqual(key, cache.input_key('g', np.array([1.0, 2.0]), 'D'))
+
+    def test_build_smfc_curve(self):
+        curves = cache.CurveCache()
+        expected = builder.build_smfc_curve(prices, start_date)
+        for _ in range(3):
+            x, y, dr, pr, y_smfc = curves.build_smfc_curve(prices, start_date)
+            self.assertEqual(x, expected[0])
+            self.assertEqual(pr, expected[3])
+            np.testing.assert_array_almost_equal(y_smfc, expected[4])
+        # The time of the start date is not part of the key.
+        curves.build_smfc_curve(prices, start_date + datetime.timedelta(hours=5))
+        stats = curves.stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['memory_hits'], 3)
+        self.assertFalse(y_smfc.flags.writeable)
+        curves.build_smfc_curve(prices, start_date, corr_avg=True)
+        self.assertEqual(curves.stats()['misses'], 2)
+        no_flat = curves.build_smfc_curve(prices, start_date, flatten=False, method='dense', output='arrays')[4]
+        self.assertEqual(len(no_flat), len(prices))
+
+    def test_calc_smfc(self):
+        curves = cache.CurveCache()
+        dr = axis.date_ranges(start_date, len(prices) - 2)
+        expected = builder.calc_smfc(dr, prices)
+        np.testing.assert_array_almost_equal(curves.calc_smfc(dr, prices), expected)
+        no_flat = curves.calc_smfc(dr, prices, flatten=False)
+        self.assertEqual([len(v) for v in no_flat], [len(d) for d in dr])
+        self.assertEqual(curves.stats()['hits'], 1)
+
+    def test_disk_tier(self):
+        curves = cache.CurveCache(max_entries=1, directory=self.dir.name)
+        y_smfc = curves.build_smfc_curve(prices, start_date)[4]
+        curves.build_smfc_curve(prices[::-1], start_date)
+        self.assertEqual(curves.stats()['memory_evictions'], 1)
+        # Read back from disk as a memory map, also from a new cache on the same directory.
+        reloaded = cache.CurveCache(directory=self.dir.name)
+        values = reloaded.build_smfc_curve(prices, start_date)[4]
+        self.assertIsInstance(values, np.memmap)
+        np.testing.assert_array_equal(values, y_smfc)
+        self.assertEqual(reloaded.stats()['disk_hits'], 1)
+        self.assertEqual(reloaded.stats()['disk_entries'], 2)
+
+    def test_disk_only(self):
+        curves = cache.CurveCache(max_entries=0, directory=self.dir.name)
+        dr = axis.date_ranges(start_date, len(prices) - 2)
+        for _ in range(2):
+            y_smfc = curves.build_smfc_curve(prices, start_date)[4]
+            values = curves.calc_smfc(dr, prices)
+        np.testing.assert_array_almost_equal(y_smfc, builder.build_smfc_curve(prices, start_date)[4])
+        np.testing.assert_array_almost_equal(values, builder.calc_smfc(dr, prices))
+        stats = curves.stats()
+        self.assertEqual((stats['misses'], stats['disk_hits'], stats['memory_entries']), (2, 2, 0))
+
+    def test_disk_eviction(self):
+        size = builder.build_smfc_curve(prices, start_date)[4].nbytes + 128
+        curves = cache.CurveCache(max_entries=1, directory=self.dir.name, max_disk_bytes=2 * size)
+        for i in range(4):
+            curves.build_smfc_curve([p + i for p in prices], start_date)
+        stats = curves.stats()
+        self.assertEqual(stats['disk_entries'], 2)
+        self.assertEqual(stats['disk_evictions'], 2)
+        self.assertEqual(len(os.listdir(self.dir.name)), 2)
+        curves.clear()
+        self.assertEqual(os.listdir(self.dir.name), [])
+
+    def test_shared_directory(self):
+        size = builder.build_smfc_curve(prices, start_date)[4].nbytes + 128
+        first = cache.CurveCache(directory=self.dir.name, max_disk_bytes=3 * size)
+        second = cache.CurveCache(directory=self.dir.name, max_disk_bytes=3 * size)
+        for i in range(3):
+            first.build_smfc_curve([p + i for p in prices], start_date)
+            second.build_smfc_curve([p + 10 + i for p in prices], start_date)
+        # The limit holds for the files of both caches.
+        self.assertEqual(len(os.listdir(self.dir.name)), 3)
+        self.assertEqual(second.stats()['disk_entries'], 3)
+
+    def test_cache_version(self):
+        key = cache.input_key('f', np.array([1.0, 2.0]))
+        version = cache.CACHE_VERSION
+        try:
+            cache.CACHE_VERSION += 1
+            self.assertNotEqual(key, cache.input_key('f', np.array([1.0, 2.0])))
+        finally:
+            cache.CACHE_VERSION = version
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import unittest
+import glob
+import importlib.util
+import os
+import tempfile
+from curvy import builder, cli
+import datetime
+import numpy as np
+import pandas as pd
+
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+has_pyarrow = importlib.util.find_spec('pyarrow') is not None
+
+class TestCliMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.input = os.path.join(self.dir.name, 'quotes.csv')
+        rows = []
+        for curve_id in ['NO1', 'SE3']:
+            for day in [26, 27]:
+                # The periods in reverse order, to be sorted by the period column.
+                for period in reversed(range(len(prices))):
+                    rows.append((curve_id, '2018-11-{}'.format(day), period, prices[period] + day))
+        self.quotes = pd.DataFrame(rows, columns=['curve_id', 'trade_date', 'period', 'price'])
+        self.quotes.to_csv(self.input, index=False)
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def expected(self, day):
+        return builder.build_smfc_curve([p + day for p in prices], datetime.datetime(2018, 11, day))[4]
+
+    def test_iter_curves(self):
+        # Chunks that split the curves.
+        chunks = [self.quotes.iloc[i:i + 7] for i in range(0, len(self.quotes), 7)]
+        curves = list(cli.iter_curves(chunks, period_column='period'))
+        self.assertEqual([(c[0], str(c[1])) for c in curves],
+                         [('NO1', '2018-11-26'), ('NO1', '2018-11-27'), ('SE3', '2018-11-26'), ('SE3', '2018-11-27')])
+        np.testing.assert_array_equal(curves[1][2], [p + 27 for p in prices])
+        with self.assertRaises(ValueError):
+            list(cli.iter_curves([self.quotes, self.quotes]))
+        # Out of order within a chunk.
+        with self.assertRaises(ValueError):
+            list(cli.iter_curves([self.quotes.iloc[::-1]]))
+
+    def test_numpy_output(self):
+        output = os.path.join(self.dir.name, 'curves')
+        self.assertEqual(cli.main([self.input, '-o', output, '--workers', '1', '--chunk-rows', '7',
+                                   '--batch-size', '3', '--period-column', 'period']), 0)
+        parts = [np.load(path) for path in sorted(glob.glob(os.path.join(output, '*.npz')))]
+        self.assertEqual(len(parts), 2)
+        ids = np.concatenate([p['curve_id'] for p in parts])
+        trade_dates = np.concatenate([p['trade_date'] for p in parts])
+        values = np.concatenate([p['value'] for p in parts])
+        mask = (ids == 'SE3') & (trade_dates == np.datetime64('2018-11-27'))
+        np.testing.assert_array_almost_equal(values[mask], self.expected(27))
+
+    @unittest.skipUnless(has_pyarrow, 'pyarrow is not installed')
+    def test_parquet(self):
+        parquet_input = os.path.join(self.dir.name, 'quotes.parquet')
+        self.quotes.to_parquet(parquet_input)
+        output = os.path.join(self.dir.name, 'curves.parquet')
+        stats = cli.run(parquet_input, output, workers=2, batch_size=2, period_column='period')
+        self.assertEqual(stats['rows'], len(self.quotes))
+        self.assertEqual(stats['curves'], 4)
+        curves = pd.read_parquet(output)
+        self.assertEqual(len(curves), stats['values'])
+        curve = curves[(curves['curve_id'] == 'NO1') & (curves['trade_date'] == datetime.date(2018, 11, 26))]
+        np.testing.assert_array_almost_equal(curve['value'], self.expected(26))
+        self.assertEqual(curve['date'].iloc[0], pd.Timestamp('2018-11-27'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from curvy import builder, curve
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestCurveMethods(unittest.TestCase):
+
+    def test_curve(self):
+        smooth = builder.build_smfc_curve(prices, start_date, output='curve')
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices, start_date)
+        self.assertEqual(smooth.params.shape, (len(prices), 5))
+        np.testing.assert_array_almost_equal(smooth.values(), y_smfc)
+        np.testing.assert_array_almost_equal(smooth(np.arange(len(x))), y_smfc)
+        np.testing.assert_array_almost_equal(smooth(x), y_smfc)
+        np.testing.assert_array_almost_equal(smooth(np.array(x[5:9], dtype='datetime64[D]')), y_smfc[5:9])
+        self.assertTrue(np.isnan(smooth(-1)))
+
+        # Between the days
+        np.testing.assert_array_almost_equal(smooth([4.5, 10.25]), smooth.to_ppoly()([4.5, 10.25]))
+
+        with self.assertRaises(ValueError):
+            curve.Curve(smooth.params, smooth.breakpoints[:-1])
+
+        with self.assertRaises(ValueError):
+            curve.Curve(smooth.params, smooth.breakpoints)(x)
+
+    def test_curve_integrate(self):
+        smooth = builder.build_smfc_curve(prices, start_date, output='curve')
+        ppoly = smooth.to_ppoly()
+        for a, b in [(0, 1), (2.5, 40), (0, smooth.breakpoints[-1])]:
+            self.assertAlmostEqual(smooth.integrate(a, b), ppoly.integrate(a, b))
+
+        # The average constraints keep the integral of each period
+        periods = smooth.integrate(smooth.breakpoints[:-1], smooth.breakpoints[1:])
+        np.testing.assert_array_almost_equal(periods / smooth.widths, prices)
+
+    def test_live_curve(self):
+        live = curve.LiveCurve(prices, start_date)
+        np.testing.assert_array_almost_equal(
+            live.y_smfc,
+            builder.build_smfc_curve(prices, start_date)[-1]
+        )
+
+        updated = list(prices)
+        for period_index, new_price in [(0, 4), (3, 9), (9, 2), (3, 5)]:
+            live.update_price(period_index, new_price)
+            updated[period_index] = new_price
+        np.testing.assert_array_equal(live.prices, updated)
+        np.testing.assert_array_almost_equal(
+            live.y_smfc,
+            builder.build_smfc_curve(updated, start_date)[-1]
+        )
+        np.testing.assert_array_almost_equal(
+            np.concatenate(live.params),
+            builder.get_plan(start_date, len(prices)).solve(updated)
+        )
+        np.testing.assert_array_almost_equal(live.to_curve().values(), live.y_smfc)
+        # The plan solves the unit solutions on request, and does not keep them.
+        plan = builder.get_plan(start_date, len(prices))
+        self.assertIsNot(plan.unit_solution(3), plan.unit_solution(3))
+        np.testing.assert_array_almost_equal(plan.unit_solution(3), plan.solve(np.eye(len(prices))[3]))
+
+    def test_live_curve_corr_avg(self):
+        live = curve.LiveCurve(prices, start_date, corr_avg=True)
+        live.update_price(2, 10)
+        updated = list(prices)
+        updated[2] = 10
+        np.testing.assert_array_almost_equal(
+            live.y_smfc,
+            builder.build_smfc_curve(updated, start_date, corr_avg=True)[-1]
+        )
+
+if __name__ == '__main__':
+    unittest.main()
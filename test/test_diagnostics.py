@@ -0,0 +1,72 @@
+import unittest
+from curvy import axis, builder, diagnostics
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6, 12, 3]
+
+class TestDiagnosticsMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.plan = builder.get_plan(start_date, len(prices))
+        self.lengths = self.plan.lengths
+
+    def test_period_means(self):
+        for corr_avg in [False, True]:
+            X = self.plan.solve(prices, corr_avg)
+            y_smfc = builder.segment_values(self.lengths, X.reshape(-1, 5), builder.smfc, local=True)
+            np.testing.assert_allclose(
+                diagnostics.average_errors(self.lengths, X, prices), builder.avg_diff(y_smfc, prices), atol=1e-12
+            )
+        np.testing.assert_allclose(diagnostics.average_errors(self.lengths, X, prices), 0, atol=1e-12)
+
+    def test_absolute_params(self):
+        dr = axis.axis_ranges(self.plan.axis)
+        X = np.concatenate(builder.calc_smfc_params(dr, prices, local=False))
+        y_smfc = builder.calc_smfc(dr, prices, flatten=False, local=False)
+        np.testing.assert_allclose(
+            diagnostics.period_means(self.lengths, X, local=False), [np.mean(r) for r in y_smfc], atol=1e-9
+        )
+        np.testing.assert_allclose(diagnostics.knot_jumps(self.lengths, X, local=False), 0, atol=1e-9)
+        np.testing.assert_allclose(
+            diagnostics.objective(self.lengths, X, local=False),
+            diagnostics.objective(self.lengths, self.plan.solve(prices)), rtol=1e-9
+        )
+
+    def test_knot_jumps(self):
+        X = self.plan.solve(prices)
+        jumps = diagnostics.knot_jumps(self.lengths, X)
+        self.assertEqual(jumps.shape, (len(prices) - 1, 3))
+        np.testing.assert_allclose(jumps, 0, atol=1e-12)
+        # Moving the constant of the 2nd segment makes a jump in the value at both its knots.
+        X = X.copy()
+        X[9] += 1
+        jumps = diagnostics.knot_jumps(self.lengths, X)
+        np.testing.assert_allclose(jumps[:2, 0], [1, -1])
+        np.testing.assert_allclose(jumps[2:, 0], 0, atol=1e-12)
+
+    def test_objective(self):
+        X = self.plan.solve(prices)
+        y_smfc = builder.segment_values(self.lengths, X.reshape(-1, 5), builder.smfc, flatten=True, local=True)
+        # Close to the sum of the squared 2nd differences of the curve values.
+        np.testing.assert_allclose(diagnostics.objective(self.lengths, X), np.sum(np.diff(y_smfc, 2)**2), rtol=0.01)
+        self.assertAlmostEqual(diagnostics.objective(self.lengths, self.plan.solve(np.full(len(prices), 5.0))), 0)
+
+    def test_diagnose_batch(self):
+        prices_matrix = np.array([prices, prices[::-1], np.full(len(prices), 5.0)])
+        X = self.plan.solve(prices_matrix)
+        result = diagnostics.diagnose(self.lengths, X, prices_matrix)
+        self.assertEqual(result['means'].shape, prices_matrix.shape)
+        self.assertEqual(result['max_error'].shape, (3,))
+        self.assertEqual(result['max_jump'].shape, (3, 3))
+        for i, p in enumerate(prices_matrix):
+            single = diagnostics.diagnose(self.lengths, X[:, i], p)
+            np.testing.assert_allclose(result['means'][i], single['means'])
+            self.assertAlmostEqual(result['max_error'][i], single['max_error'])
+            self.assertAlmostEqual(result['objective'][i], single['objective'])
+        with self.assertRaises(ValueError):
+            diagnostics.period_means(self.lengths[1:], X)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from curvy import builder, frames
+import datetime
+import numpy as np
+import pandas as pd
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestFramesMethods(unittest.TestCase):
+
+    def test_build_smfc_curve(self):
+        frame = builder.build_smfc_curve(prices, start_date, output='pandas')
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices, start_date)
+        self.assertIsInstance(frame.index, pd.DatetimeIndex)
+        self.assertEqual(list(frame.columns), ['period', 'price', 'smfc'])
+        self.assertEqual(frame.index[0], pd.Timestamp(x[0]))
+        np.testing.assert_array_equal(frame['price'], y)
+        np.testing.assert_array_almost_equal(frame['smfc'], y_smfc)
+        np.testing.assert_array_equal(frame.groupby('period').size(), [len(d) for d in dr])
+        dense = builder.build_smfc_curve(prices, start_date, method='dense', output='pandas')
+        np.testing.assert_array_almost_equal(dense['smfc'], y_smfc)
+
+    def test_hourly(self):
+        frame = builder.build_smfc_curve(prices, start_date, resolution='h', tz='Europe/Oslo', output='pandas')
+        self.assertEqual(str(frame.index.tz), 'Europe/Oslo')
+        self.assertEqual(frame.index[0], pd.Timestamp('2018-11-27', tz='Europe/Oslo'))
+
+    def test_zero_copy(self):
+        y_smfc = np.arange(10, dtype='float64')
+        period = builder.get_plan(start_date, len(prices)).axis
+        dates = period.dates[:10].astype('datetime64[s]')
+        self.assertTrue(np.shares_memory(frames.date_index(dates).asi8, dates))
+        curves = np.vstack((y_smfc, y_smfc))
+        wide = frames.curves_frame(dates, curves)
+        self.assertEqual(wide.shape, (10, 2))
+        self.assertTrue(np.shares_memory(wide.to_numpy(), curves))
+        values = np.zeros(len(period.dates))
+        frame = frames.axis_frame(period, prices, y_smfc=values)
+        self.assertTrue(np.shares_memory(frame['smfc'].to_numpy(), values))
+
+    def test_build_smfc_curves(self):
+        frame = builder.build_smfc_curves([prices, prices[::-1]], start_date, output='pandas')
+        x, dr, y_smfc = builder.build_smfc_curves([prices, prices[::-1]], start_date)
+        self.assertEqual(frame.shape, (len(x), 2))
+        np.testing.assert_array_almost_equal(frame[1], y_smfc[1])
+
+if __name__ == '__main__':
+    unittest.main()
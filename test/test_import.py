@@ -0,0 +1,36 @@
+import unittest
+import subprocess
+import sys
+import json
+
+# Imports curvy in a fresh interpreter, after numpy, and returns the import time and the
+# heavy modules that were loaded.
+IMPORT_SCRIPT = '''
+import json, sys, time
+import numpy
+start = time.perf_counter()
+import curvy, curvy.plot
+elapsed = time.perf_counter() - start
+heavy = [m for m in ('scipy', 'matplotlib', 'pandas', 'numpy.matlib') if m in sys.modules]
+print(json.dumps({'time': elapsed, 'heavy': heavy}))
+'''
+
+# Time budget for importing curvy on top of numpy, in seconds.
+IMPORT_BUDGET = 0.25
+
+class TestImport(unittest.TestCase):
+
+    def import_curvy(self):
+        result = subprocess.run([sys.executable, '-c', IMPORT_SCRIPT], capture_output=True, text=True, check=True)
+        return json.loads(result.stdout)
+
+    def test_no_heavy_imports(self):
+        self.assertEqual(self.import_curvy()['heavy'], [])
+
+    def test_import_budget(self):
+        # The best of a few runs, as the first one may have to compile the modules.
+        elapsed = min(self.import_curvy()['time'] for _ in range(3))
+        self.assertLess(elapsed, IMPORT_BUDGET)
+
+if __name__ == '__main__':
+    unittest.main()
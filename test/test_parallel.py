@@ -0,0 +1,41 @@
+import unittest
+from curvy import builder, parallel
+import datetime
+import numpy as np
+
+class TestParallelMethods(unittest.TestCase):
+
+    def test_group_inputs(self):
+        inputs = {
+            'a': ([1, 2, 3], datetime.datetime(2018, 11, 26, 8)),
+            'b': ([3, 2, 1], datetime.datetime(2018, 11, 26, 17)),
+            'c': ([1, 2, 3, 4], datetime.datetime(2018, 11, 26)),
+            'd': ([1, 2, 3], datetime.datetime(2018, 11, 27)),
+        }
+        self.assertEqual(
+            parallel.group_inputs(inputs),
+            {
+                (datetime.date(2018, 11, 26), 3, 'D', None): ['a', 'b'],
+                (datetime.date(2018, 11, 26), 4, 'D', None): ['c'],
+                (datetime.date(2018, 11, 27), 3, 'D', None): ['d'],
+            }
+        )
+
+    def test_build_smfc_curves_parallel(self):
+        inputs = {}
+        for i in range(10):
+            prices = [3 + i % 4, 4, 6, 5, 7, 8, 6, 4][:6 + i % 3]
+            inputs['curve_{}'.format(i)] = (prices, datetime.datetime(2018, 11, 24 + i % 3))
+
+        curves = parallel.build_smfc_curves_parallel(inputs, max_workers=2, chunksize=2, corr_avg=True)
+        self.assertEqual(set(curves), set(inputs))
+        for curve_id, (prices, start_date) in inputs.items():
+            x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices, start_date, corr_avg=True)
+            self.assertEqual(curves[curve_id][0].tolist(), x)
+            np.testing.assert_array_almost_equal(curves[curve_id][1], y_smfc)
+
+        with self.assertRaises(ValueError):
+            parallel.build_smfc_curves_parallel(inputs, chunksize=0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+import importlib.util
+from curvy import builder, plot
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+has_matplotlib = importlib.util.find_spec('matplotlib') is not None
+
+class TestPlotMethods(unittest.TestCase):
+
+    def test_minmax_indices(self):
+        y = np.sin(np.arange(10000) / 100)
+        y[1234] = 5
+        indices = plot.minmax_indices(y, 50)
+        self.assertLessEqual(len(indices), 102)
+        self.assertIn(1234, indices)
+        self.assertEqual(indices[0], 0)
+        self.assertEqual(indices[-1], len(y) - 1)
+        self.assertEqual(y[indices].min(), y.min())
+
+    def test_lttb_indices(self):
+        x = np.arange(10000)
+        y = np.sin(x / 100)
+        y[4321] = -5
+        indices = plot.lttb_indices(x, y, 200)
+        self.assertEqual(len(indices), 200)
+        self.assertTrue((np.diff(indices) > 0).all())
+        self.assertIn(4321, indices)
+        np.testing.assert_array_equal(plot.lttb_indices(x[:10], y[:10], 200), np.arange(10))
+
+    def test_decimate_points(self):
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices, start_date, resolution='h')
+        for method in plot.DECIMATE_METHODS:
+            dx, dy = plot.decimate_points(x, y_smfc, 500, method)
+            self.assertLessEqual(len(dy), 502)
+            self.assertEqual(dx.dtype, np.dtype('datetime64[us]'))
+        dx, dy = plot.decimate_points(x, y_smfc, 500, None)
+        self.assertEqual(len(dy), len(y_smfc))
+        with self.assertRaises(ValueError):
+            plot.decimate_points(x, y_smfc, 500, 'mean')
+
+    @unittest.skipUnless(has_matplotlib, 'matplotlib is not installed')
+    def test_plot_agg(self):
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.colors
+        import matplotlib.pyplot as plt
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices, start_date, resolution='h', output='arrays')
+        fig, ax = plot.mpl_create_curve_plot(x)
+        plot.mpl_plot_curves(x, y, fig, ax, (x, y_smfc, 'green', '-'))
+        self.assertEqual(len(ax.lines), 2)
+        self.assertLess(len(ax.lines[1].get_xdata()), len(x))
+        fig, ax = plot.mpl_create_curve_plot(x)
+        sections = np.split(y_smfc, np.cumsum([len(d) for d in dr])[:-1])
+        plot.mpl_plot_curve_sections(x, y, fig, ax, (dr, sections), hide_price=True)
+        self.assertEqual(len(ax.collections), 1)
+        self.assertEqual(len(ax.collections[0].get_segments()), len(prices))
+        # The colors continue from the sections of one arg to the next.
+        fig, ax = plot.mpl_create_curve_plot(x)
+        plot.mpl_plot_curve_sections(x, y, fig, ax, (dr, sections), (dr, sections), hide_price=True)
+        colors = np.concatenate([c.get_colors() for c in ax.collections])
+        expected = [matplotlib.colors.to_rgba('C{}'.format(i % 10)) for i in range(2 * len(prices))]
+        np.testing.assert_array_almost_equal(colors, expected)
+        plt.close('all')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+from curvy import builder, products
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestProductsMethods(unittest.TestCase):
+
+    def test_product_bounds(self):
+        codes = ['DA', 'BOM', 'WE', 'WE+1', 'W+1', 'M+0', 'M+1', 'Q+1', 'S+1', 'Y+1']
+        begins, ends = products.product_bounds(start_date, codes)
+        expected = [
+            ('2018-11-27', '2018-11-28'), ('2018-11-28', '2018-12-01'), ('2018-12-01', '2018-12-03'),
+            ('2018-12-08', '2018-12-10'), ('2018-12-03', '2018-12-10'), ('2018-11-01', '2018-12-01'),
+            ('2018-12-01', '2019-01-01'), ('2019-01-01', '2019-04-01'), ('2019-04-01', '2019-10-01'),
+            ('2019-01-01', '2020-01-01'),
+        ]
+        np.testing.assert_array_equal(begins, np.array([b for b, e in expected], dtype='datetime64[D]'))
+        np.testing.assert_array_equal(ends, np.array([e for b, e in expected], dtype='datetime64[D]'))
+
+    def test_parse_products(self):
+        kinds, offsets = products.parse_products(['DA', 'M+1', 'Q+2'])
+        np.testing.assert_array_equal(kinds, [0, 4, 5])
+        np.testing.assert_array_equal(offsets, [0, 1, 2])
+        for code in ['M', 'DA+1', 'X+1', 'm+1']:
+            with self.assertRaises(ValueError):
+                products.parse_products([code])
+
+    def test_segment_prices(self):
+        # A quarter and its first month are split into the month and the rest of the quarter.
+        begins, ends = products.product_bounds(start_date, ['M+2', 'Q+1'])
+        bounds, cover = products.product_segments(begins, ends)
+        np.testing.assert_array_equal(bounds, np.array(['2019-01-01', '2019-02-01', '2019-04-01'], dtype='datetime64[D]'))
+        np.testing.assert_array_equal(cover, [[True, False], [True, True]])
+        lengths = np.diff(bounds).astype('int64')
+        y = products.segment_prices(cover, lengths, [40, 37])
+        np.testing.assert_array_almost_equal(y, [40, (37 * 90 - 40 * 31) / 59])
+
+    def test_segment_prices_errors(self):
+        cover = np.array([[True, False], [False, True], [True, True]])
+        with self.assertRaises(ValueError):
+            products.segment_prices(cover, np.array([31, 28]), [40, 30, 20])
+        with self.assertRaises(ValueError):
+            products.segment_prices(cover[2:], np.array([31, 28]), [40])
+        with self.assertRaises(ValueError):
+            products.product_segments(*products.product_bounds(start_date, ['DA', 'M+2']))
+
+    def test_build_product_curve(self):
+        # DA, BOM and the months give the same curve as build_smfc_curve.
+        codes = ['DA', 'BOM'] + ['M+{}'.format(i) for i in range(1, 9)]
+        x, y, dr, pr, y_smfc = products.build_product_curve(prices, codes, start_date)
+        expected = builder.build_smfc_curve(prices, start_date)
+        self.assertEqual(x, expected[0])
+        np.testing.assert_array_almost_equal(y_smfc, expected[4])
+
+    def test_build_overlapping_products(self):
+        codes = ['DA', 'BOM', 'M+1', 'Q+1', 'Y+1']
+        x, y, dr, pr, y_smfc = products.build_product_curve([30, 32, 35, 34, 33], codes, start_date,
+                                                            output='arrays', corr_avg=True)
+        self.assertEqual([len(d) for d in dr], [1, 3, 31, 90, 275])
+        # The mean of the curve over each product is its price.
+        begins, ends = products.product_bounds(start_date, codes)
+        for begin, end, price in zip(begins, ends, [30, 32, 35, 34, 33]):
+            self.assertAlmostEqual(y_smfc[(x >= begin) & (x < end)].mean(), price)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from curvy import builder, profiling
+import datetime
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestProfilingMethods(unittest.TestCase):
+
+    def setUp(self):
+        builder.clear_plan_cache()
+
+    def test_profile(self):
+        with profiling.profile() as prof:
+            builder.build_smfc_curve(prices, start_date)
+            builder.build_smfc_curve(prices, start_date)
+        self.assertEqual([r['build'] for r in prof.records], ['build_smfc_curve'] * 2)
+        first = [e['stage'] for e in prof.records[0]['stages']]
+        self.assertEqual(first, ['calendar', 'assembly', 'factorize', 'calendar', 'solve', 'evaluate'])
+        # The plan is cached, so the second build skips the calendar and factorization.
+        second = [e['stage'] for e in prof.records[1]['stages']]
+        self.assertEqual(second, ['calendar', 'solve', 'evaluate'])
+        assembly = prof.records[0]['stages'][1]
+        self.assertEqual(assembly['num_segments'], len(prices))
+        self.assertEqual(assembly['shape'], (9 * len(prices) - 3,) * 2)
+        summary = prof.summary()
+        self.assertEqual(summary['build:build_smfc_curve']['count'], 2)
+        self.assertEqual(summary['solve']['count'], 2)
+        self.assertLessEqual(summary['solve']['min'], summary['solve']['max'])
+        self.assertEqual(len(prof.to_rows()), 9)
+
+    def test_dense(self):
+        with profiling.profile(trace_memory=True) as prof:
+            builder.build_smfc_curve(prices, start_date, method='dense')
+        stages = [e['stage'] for e in prof.records[0]['stages']]
+        self.assertEqual(stages, ['calendar', 'assembly', 'solve', 'evaluate'])
+        self.assertIn('peak_memory', prof.records[0]['stages'][1])
+
+    def test_callback(self):
+        records = []
+        profiling.add_callback(records.append)
+        try:
+            builder.build_smfc_curves([prices, prices], start_date)
+        finally:
+            profiling.remove_callback(records.append)
+        self.assertEqual(len(records), 1)
+        self.assertEqual(records[0]['build'], 'build_smfc_curves')
+        self.assertFalse(profiling.enabled())
+
+    def test_disabled(self):
+        with profiling.profile() as prof:
+            pass
+        builder.build_smfc_curve(prices, start_date)
+        self.assertEqual(prof.records, [])
+        self.assertIs(profiling.stage('solve'), profiling.stage('evaluate'))
+
+if __name__ == '__main__':
+    unittest.main()
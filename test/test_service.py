@@ -0,0 +1,73 @@
+import unittest
+import asyncio
+from curvy import builder, service
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestServiceMethods(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.service = service.CurveService(batch_window=0.01)
+
+    async def asyncTearDown(self):
+        self.service.close()
+
+    async def test_build(self):
+        dates, values = await self.service.build(prices, start_date)
+        x, y, dr, pr, y_smfc = builder.build_smfc_curve(prices, start_date)
+        self.assertEqual(dates.tolist(), x)
+        np.testing.assert_array_almost_equal(values, y_smfc)
+
+    async def test_coalesce_and_batch(self):
+        other = [p + 1 for p in prices]
+        results = await asyncio.gather(
+            self.service.build(prices, start_date),
+            self.service.build(prices, start_date),
+            self.service.build(other, start_date),
+        )
+        metrics = self.service.metrics()
+        self.assertEqual(metrics['requests'], 3)
+        self.assertEqual(metrics['coalesced'], 1)
+        self.assertEqual(metrics['batches'], 1)
+        self.assertEqual(metrics['mean_batch_size'], 2)
+        self.assertEqual(metrics['queue_depth'], 0)
+        self.assertIs(results[0][1], results[1][1])
+        np.testing.assert_array_almost_equal(results[2][1], builder.build_smfc_curve(other, start_date)[4])
+
+    async def test_max_batch(self):
+        self.service.max_batch = 2
+        await asyncio.gather(*[self.service.build([p + i for p in prices], start_date) for i in range(5)])
+        self.assertEqual(self.service.metrics()['batches'], 3)
+
+    async def test_local_client(self):
+        client = service.LocalClient(self.service)
+        response = await client.build(prices, start_date)
+        self.assertEqual(response['dates'][0], '2018-11-27')
+        np.testing.assert_array_almost_equal(response['values'], builder.build_smfc_curve(prices, start_date)[4])
+        response = await client.request({'prices': [1], 'start_date': '2018-11-26'})
+        self.assertIn('error', response)
+        self.assertEqual((await client.metrics())['requests'], 2)
+
+    async def test_socket_client(self):
+        server = await self.service.start_server(port=0)
+        port = server.sockets[0].getsockname()[1]
+        client = service.SocketClient(port=port)
+        try:
+            response = await client.build(prices, start_date)
+            self.assertEqual(len(response['values']), len(response['dates']))
+            self.assertIn('error', await client.request({'prices': prices}))
+            # A message that is not an object is answered with an error, and the connection is kept.
+            self.assertIn('error', await client.request([1, 2]))
+            self.assertIn('error', await client.request({'prices': prices, 'start_date': 5}))
+            response = await asyncio.wait_for(client.build(prices, start_date), 5)
+            self.assertIn('values', response)
+        finally:
+            await client.close()
+            server.close()
+            await server.wait_closed()
+
+if __name__ == '__main__':
+    unittest.main()
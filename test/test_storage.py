@@ -0,0 +1,80 @@
+import unittest
+import os
+import tempfile
+from curvy import builder, storage
+import datetime
+import numpy as np
+
+start_date = datetime.datetime(2018, 11, 26)
+prices = [3, 4, 6, 5, 7, 8, 6, 4, 5, 6]
+
+class TestStorageMethods(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.dir.name, 'curves.crvy')
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_save_load(self):
+        curve = builder.build_smfc_curve(prices, start_date, output='curve')
+        storage.save_curve(self.path, curve, prices, metadata={'area': 'NO1'})
+        record = storage.load_curve(self.path)
+        np.testing.assert_array_equal(record.curve.params, curve.params)
+        np.testing.assert_array_equal(record.curve.breakpoints, curve.breakpoints)
+        np.testing.assert_array_equal(record.prices, prices)
+        self.assertEqual(record.metadata, {'area': 'NO1'})
+        self.assertEqual(record.curve.origin, curve.origin)
+        np.testing.assert_array_almost_equal(record.curve.values(), builder.build_smfc_curve(prices, start_date)[4])
+        # The arrays are read-only views of the memory map.
+        self.assertFalse(record.curve.params.flags.writeable)
+        self.assertFalse(record.curve.params.flags.owndata)
+
+    def test_archive(self):
+        hourly = builder.build_smfc_curve(prices, start_date, output='curve', resolution='h', tz='Europe/Oslo')
+        daily = builder.build_smfc_curve(prices, start_date, output='curve')
+        with storage.CurveArchive(self.path) as archive:
+            archive.append(daily, prices, key='daily')
+            archive.append(hourly, key='hourly')
+            self.assertEqual(len(archive), 2)
+            archive.append(daily)
+            self.assertEqual(len(archive), 3)
+            self.assertEqual(archive.keys(), ['daily', 'hourly'])
+            record = archive['hourly']
+            self.assertIsNone(record.prices)
+            self.assertEqual(record.curve.step, np.timedelta64(60, 'm'))
+            np.testing.assert_array_equal(record.curve(np.arange(100)), hourly(np.arange(100)))
+            self.assertEqual([r.key for r in archive], ['daily', 'hourly', None])
+        # The coefficients are much smaller than the hourly curve values.
+        self.assertLess(os.path.getsize(self.path) * 20, hourly.values().nbytes)
+
+    def test_partial_record(self):
+        curve = builder.build_smfc_curve(prices, start_date, output='curve')
+        with storage.CurveArchive(self.path) as archive:
+            archive.extend([(curve, prices, 'a', None), (curve, prices, 'b', None)])
+        # An interrupted append leaves a partial record at the end, which is ignored.
+        size = os.path.getsize(self.path)
+        for cut in [20, size // 2 - 10]:
+            os.truncate(self.path, size - cut)
+            with storage.CurveArchive(self.path) as archive:
+                self.assertEqual(archive.keys(), ['a'])
+                self.assertEqual(len(archive), 1)
+                np.testing.assert_array_equal(archive['a'].prices, prices)
+                # and removed by the next append.
+                archive.append(curve, prices, key='b')
+                self.assertEqual(archive.keys(), ['a', 'b'])
+                np.testing.assert_array_equal(archive['b'].curve.params, curve.params)
+            self.assertEqual(os.path.getsize(self.path), size)
+
+    def test_errors(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'not a curve archive')
+        with self.assertRaises(ValueError):
+            storage.load_curve(self.path)
+        curve = builder.build_smfc_curve(prices, start_date, output='curve')
+        with self.assertRaises(ValueError):
+            storage.save_curve(self.path, curve, prices[:-1])
+
+if __name__ == '__main__':
+    unittest.main()